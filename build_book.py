@@ -0,0 +1,18 @@
+import sys
+import time
+
+from lib.opening_book import OpeningBook, read_records
+
+# Usage: python build_book.py [board size] [book file] [replay dirs, JSON replays or shards...]
+# The replays from baseline_game.py and gpt_game.py are 6x6.
+MAX_PLY = 12
+
+if __name__ == '__main__':
+    dim = int(sys.argv[1]) if len(sys.argv) > 1 else 6
+    book_path = sys.argv[2] if len(sys.argv) > 2 else f'opening_book_{dim}.rvb'
+    paths = sys.argv[3:] or ['replays']
+    start = time.perf_counter()
+    book = OpeningBook.build(read_records(paths), dim=dim, max_ply=MAX_PLY)
+    book.save(book_path)
+    print(f"Indexed {len(book)} positions from {book.num_games} games in {time.perf_counter() - start:.1f}s, saved to '{book_path}'")
+    print(f"Skipped {book.num_skipped} games that were unfinished or not {dim}x{dim}")
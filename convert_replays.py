@@ -0,0 +1,13 @@
+import glob
+import os
+import sys
+
+from lib.replay_shard import convert_json_replays
+
+# Usage: python convert_replays.py [replay dir] [shard file]
+replay_dir = sys.argv[1] if len(sys.argv) > 1 else 'replays'
+shard_path = sys.argv[2] if len(sys.argv) > 2 else os.path.join(replay_dir, 'replays.rvs')
+
+json_files = sorted(glob.glob(os.path.join(replay_dir, '*.json')))
+count = convert_json_replays(json_files, shard_path)
+print(f"Wrote {count} games to '{shard_path}'")
@@ -0,0 +1,106 @@
+import contextlib
+import io
+import random
+import sys
+import time
+
+import openai
+
+from lib.agents import DualAgent, GPTAgent, GreedyGPTAgent, MinimaxGPTAgent, RandomAgent, ReversiAgent
+from lib.mock_llm import MockChatServer, use_mock
+from lib.reversi_game import ReversiGame
+
+# Games per scenario, board size, and the mock API's simulated latency (seconds per request)
+GAMES = 5
+DIM = 6
+LATENCY = 0.0
+
+class TimedAgent(ReversiAgent):
+    '''
+    Wraps an agent to total the time spent choosing moves
+    '''
+    def __init__(self, agent):
+        self.agent = agent
+        self.moves = 0
+        self.elapsed = 0.0
+
+    def policy(self, legal_actions, env, prev_env):
+        start = time.perf_counter()
+        action = self.agent.policy(legal_actions, env, prev_env)
+        self.elapsed += time.perf_counter() - start
+        self.moves += 1
+        return action
+
+class ApiTimer(object):
+    '''
+    Times calls to openai.ChatCompletion.create, i.e. everything that counts as the network,
+    including reading streamed responses
+    '''
+    def __init__(self):
+        self.calls = 0
+        self.elapsed = 0.0
+        self.create = None
+
+    def __enter__(self):
+        self.create = openai.ChatCompletion.create
+
+        def timed_stream(chunks):
+            while True:
+                start = time.perf_counter()
+                chunk = next(chunks, None)
+                self.elapsed += time.perf_counter() - start
+                if chunk is None:
+                    return
+                yield chunk
+
+        def timed_create(*args, **kwargs):
+            start = time.perf_counter()
+            try:
+                response = self.create(*args, **kwargs)
+            finally:
+                self.elapsed += time.perf_counter() - start
+                self.calls += 1
+            return timed_stream(response) if kwargs.get('stream') else response
+        openai.ChatCompletion.create = timed_create
+        return self
+
+    def __exit__(self, *exc):
+        openai.ChatCompletion.create = self.create
+
+def benchmark(name, make_agent, games=GAMES, dim=DIM, **server_args):
+    random.seed(0)
+    gpt = TimedAgent(make_agent())
+    completed = invalid = 0
+    with MockChatServer(**server_args) as server, use_mock(server), ApiTimer() as api:
+        start = time.perf_counter()
+        for i in range(games):
+            dual = DualAgent(gpt, RandomAgent()) if i % 2 == 0 else DualAgent(RandomAgent(), gpt)
+            game = ReversiGame(dim, dual, headless=True, verbose=False)
+            try:
+                # The agents print every prompt and response
+                with contextlib.redirect_stdout(io.StringIO()):
+                    game.play()
+                completed += 1
+            except ValueError:
+                invalid += 1
+        elapsed = time.perf_counter() - start
+
+    overhead = (gpt.elapsed - api.elapsed) / gpt.moves if gpt.moves else 0.0
+    print(f"{name:<28} {completed / elapsed * 60:>9.1f} {overhead * 1000:>13.2f} {api.calls:>9} {server.errors:>7} {completed:>6} {invalid:>7}")
+
+if __name__ == '__main__':
+    latency = float(sys.argv[1]) if len(sys.argv) > 1 else LATENCY
+    print(f"{GAMES} games per scenario on {DIM}x{DIM} against RandomAgent, {latency}s simulated latency")
+    print(f"{'scenario':<28} {'games/min':>9} {'overhead/ms':>13} {'requests':>9} {'errors':>7} {'games':>6} {'invalid':>7}")
+    for stream in [False, True]:
+        suffix = ' (stream)' if stream else ''
+        benchmark(f"GPTAgent{suffix}", lambda: GPTAgent(stream=stream), latency=latency)
+        benchmark(f"GreedyGPTAgent{suffix}", lambda: GreedyGPTAgent(stream=stream), latency=latency)
+        benchmark(f"MinimaxGPTAgent{suffix}", lambda: MinimaxGPTAgent(stream=stream), latency=latency)
+
+    # Injected failures: 429s and 500s are retried with backoff (which counts as overhead here), so
+    # games slow down but should still finish.
+    # Unparseable answers end the game with a ValueError, counted as invalid.
+    benchmark("GPTAgent, 10% 429s", GPTAgent, games=2, latency=latency, error_rate=0.1)
+    benchmark("GPTAgent, 10% 500s", GPTAgent, games=2, latency=latency, error_rate=0.1, error_status=500)
+    benchmark("GPTAgent, garbage answers", GPTAgent, latency=latency, responses=["I'm not sure.", "z9."])
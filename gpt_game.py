@@ -1,26 +1,24 @@
+import asyncio
 import json
 
 import numpy as np
 import pandas as pd
 
-from lib.agents import DualAgent, GreedyGPTAgent, GPTAgent, RandomAgent, ScoreGreedyAgent, ScoreMinimaxAgent
+from lib.agents import GreedyGPTAgent, RandomAgent, ScoreGreedyAgent, ScoreMinimaxAgent
+from lib.async_game import AsyncDualAgent, AsyncReversiGame, play_games
 from lib.constants import PLAYER, BLACK, WHITE
 from lib.replay import Replay
-from lib.reversi_game import ReversiGame
+
+# How many games may be waiting on the API at once
+CONCURRENCY = 16
 
 def gpt_game(dims, other_agent, gpt_player, shots, replay, visualize=False, record_file=None):
     gpt = GreedyGPTAgent(model="gpt-3.5-turbo", learning_shots=shots, replay=replay, visualize=visualize)
     if gpt_player == BLACK:
-        dual = DualAgent(gpt, other_agent)
+        dual = AsyncDualAgent(gpt, other_agent)
     else:
-        dual = DualAgent(other_agent, gpt)
-    rg = ReversiGame(dims, dual, headless=True, record_file=record_file)
-    try:
-        result = rg.play()
-    except ValueError as e:
-        print(e)
-        result = 2
-    return result
+        dual = AsyncDualAgent(other_agent, gpt)
+    return AsyncReversiGame(dims, dual, headless=True, verbose=False, record_file=record_file)
 
 # Replace this with any replay suitable for generating learning examples for GPT
 replay = Replay("replays/authoritative_8.json")
@@ -29,20 +27,29 @@ results = {'opponent': [], 'shots': [], 'gpt_player': [], 'visualize': [], 'vict
 random = RandomAgent()
 greedy = ScoreGreedyAgent()
 minimax3 = ScoreMinimaxAgent(3)
+games = []
+for i in range(10):
+    for shots in range(2, 3):
+        for gpt_player in [BLACK, WHITE]:
+            for visualize in [True, False]:
+                #for opponent, opp_agent in [('random', random), ('greedy', greedy), ('minimax3', minimax3)]:
+                for opponent, opp_agent in [('random', random)]:
+                    games.append(gpt_game(6, opp_agent, gpt_player, shots, replay, visualize, f'replays/gpt_{i}_{opponent}_{shots}_{gpt_player}.json'))
+                    results['opponent'].append(opponent)
+                    results['shots'].append(shots)
+                    results['gpt_player'].append(gpt_player)
+                    results['visualize'].append(visualize)
 try:
-    for i in range(10):
-        for shots in range(2, 3):
-            for gpt_player in [BLACK, WHITE]:
-                for visualize in [True, False]:
-                    #for opponent, opp_agent in [('random', random), ('greedy', greedy), ('minimax3', minimax3)]:
-                    for opponent, opp_agent in [('random', random)]:
-                        result = gpt_game(6, opp_agent, gpt_player, shots, replay, f'replays/gpt_{i}_{opponent}_{shots}_{gpt_player}.json')
-                        results['opponent'].append(opponent)
-                        results['shots'].append(shots)
-                        results['gpt_player'].append(gpt_player)
-                        results['visualize'].append(visualize)
-                        results['victor'].append(result)
+    for outcome in asyncio.run(play_games(games, CONCURRENCY)):
+        if isinstance(outcome, ValueError):
+            print(outcome)
+            outcome = 2
+        elif isinstance(outcome, BaseException):
+            raise outcome
+        results['victor'].append(outcome)
 finally:
+    # Only keep the games that finished
+    results = {key: values[:len(results['victor'])] for key, values in results.items()}
     df = pd.DataFrame(results)
     df['result'] = 'Tie'
     df.loc[df['gpt_player'] == df['victor'], 'result'] = 'Win'
@@ -21,8 +21,7 @@ try:
         #rg.play()
 
         replay = Replay(replay_file)
-        for turn in range(len(replay.actions)):
-            env = replay.state_before_turn(turn)
+        for turn, env, _ in replay:
             for shots in range(1):
                 for viz in [True, False]:
                     resp = legal_query("gpt-3.5-turbo", env, shots, learning_replay, visualize=viz)
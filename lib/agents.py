@@ -1,10 +1,21 @@
+import functools
 import random
+import re
 import time
 
-from .alphabeta import alphabeta
+from .alphabeta import alphabeta, aspiration_search, root_search, SearchTimeout
+from .batch_eval import child_boards, disc_difference
+from .bitboard_environment import BitboardEnvironment
 from .constants import BLACK, WHITE, PLAYER
 from .display_board import board2str
+from .endgame import solve_root
 from .notation import extract_notation, extract_all_notation
+from .opening_book import OpeningBook
+from .parallel_search import get_pool, parallel_root_search
+from .move_ordering import MoveOrderer
+from .pattern_eval import PatternEvaluator
+from .search_stats import SearchStats
+from .transposition import TranspositionTable
 from . import gpt_query
 
 class ReversiAgent(object):
@@ -23,6 +34,13 @@ class ReversiAgent(object):
     def policy(self, legal_actions, env, prev_env):
         raise NotImplementedError()
 
+    def move_stats(self, player):
+        '''
+        Dict of counters describing how the last move for player was chosen, or None if this agent
+        doesn't keep any. Recorded by instrumented ReversiGames.
+        '''
+        return None
+
 
 KEYS = 'qwertyuiopasdfghjklzxcvbnm'
 
@@ -53,11 +71,15 @@ class HumanAgent(ReversiAgent):
 
 class GPTAgent(ReversiAgent):
 
-    def __init__(self, model="gpt-3.5-turbo", learning_shots=0, replay=None, visualize=False):
+    def __init__(self, model="gpt-3.5-turbo", learning_shots=0, replay=None, visualize=False, stream=False):
+        '''
+        stream: stream responses and stop reading as soon as early_moves finds a legal move in them
+        '''
         self.model = model
         self.learning_shots=learning_shots
         self.replay = replay
         self.visualize = visualize
+        self.stream = stream
 
     def forced_pass(self, env):
         print(f"No legal actions for GPT Agent so no query sent")
@@ -67,12 +89,44 @@ class GPTAgent(ReversiAgent):
         if len(legal_actions) == 1:
             print(f"Single legal action - no query sent")
             return list(legal_actions)[0]
-        response = self.query(env, legal_actions)
-        move = self.parse_response(response, legal_actions)
+        response = self.query(env, legal_actions, send=self.sender(legal_actions))
+        move = self.response_move(response, legal_actions)
         return move
 
-    def query(self, env, legal_actions):
-        return gpt_query.move_query(self.model, env, legal_actions, self.learning_shots, self.replay, self.visualize)
+    def sender(self, legal_actions, send=None):
+        '''
+        The function to send this move's prompt with: send (gpt_query.query by default), set up to
+        stop streaming once a move is found if this agent streams
+        '''
+        send = send or gpt_query.query
+        if not self.stream:
+            return send
+
+        def move_parsed(text):
+            return bool(self.early_moves(text, legal_actions))
+        return functools.partial(send, stop_when=move_parsed)
+
+    def response_move(self, response, legal_actions):
+        if self.stream:
+            moves = self.early_moves(response, legal_actions)
+            if moves:
+                return random.choice(moves)
+        return self.parse_response(response, legal_actions)
+
+    def early_moves(self, partial_response, legal_actions):
+        '''
+        Moves that can already be read off an incomplete response: the first legal move mentioned
+        '''
+        for move in extract_all_notation(partial_response):
+            if move in legal_actions:
+                return [move]
+        return []
+
+    def query(self, env, legal_actions, send=None):
+        '''
+        send: function that sends the finished prompt (gpt_query.query by default)
+        '''
+        return gpt_query.move_query(self.model, env, legal_actions, self.learning_shots, self.replay, self.visualize, send=send)
     
     def parse_response(self, response, legal_actions):
         match = extract_notation(response)
@@ -80,9 +134,20 @@ class GPTAgent(ReversiAgent):
             raise ValueError(f"Couldn't parse GPT response '{response}'")
         return match
 
+FINAL_SENTENCE = re.compile(r'best moves? (?:is|are|would be)\s*:?\s*([^\n]*?)\.(?:\s|$)')
+
 class GreedyGPTAgent(GPTAgent):
-    def query(self, env, legal_actions):
-        return gpt_query.greedy_query(self.model, env, legal_actions, self.learning_shots, self.replay, self.visualize)
+    def query(self, env, legal_actions, send=None):
+        return gpt_query.greedy_query(self.model, env, legal_actions, self.learning_shots, self.replay, self.visualize, send=send)
+
+    def early_moves(self, partial_response, legal_actions):
+        '''
+        Legal moves in a completed "the best move(s) is/are ..." sentence, which the examples end on
+        '''
+        match = FINAL_SENTENCE.search(partial_response)
+        if match is None:
+            return []
+        return [m for m in extract_all_notation(match.group(1)) if m in legal_actions]
 
     def parse_response(self, response, legal_actions):
         last_clause = response.split('\n\n')[-1]
@@ -96,14 +161,14 @@ class GreedyGPTAgent(GPTAgent):
             raise ValueError(f"No legal move in final clause '{last_clause}'")
 
 class GreedyGPTVisualAgent(GreedyGPTAgent):
-    def __init__(self, model="gpt-3.5-turbo", learning_shots=0, replay=None):
-        return super().__init__(model=model, learning_shots=learning_shots, replay=replay, visualize=True)
+    def __init__(self, model="gpt-3.5-turbo", learning_shots=0, replay=None, stream=False):
+        return super().__init__(model=model, learning_shots=learning_shots, replay=replay, visualize=True, stream=stream)
 
-    def query(self, env, legal_actions):
-        return gpt_query.greedy_visual_query(self.model, env, legal_actions, self.learning_shots, self.replay)
+    def query(self, env, legal_actions, send=None):
+        return gpt_query.greedy_visual_query(self.model, env, legal_actions, self.learning_shots, self.replay, send=send)
 
 class MinimaxGPTAgent(GPTAgent):
-    def __init__(self, model="gpt-3.5-turbo", learning_shots=0, replay=None, search_depth=1, lookahead=1):
+    def __init__(self, model="gpt-3.5-turbo", learning_shots=0, replay=None, search_depth=1, lookahead=1, stream=False):
         '''
         Search depth = how deep the minimax search tree goes when deciding on a move
         Lookahead = how many moves in the future of minimax play to make before evaluating competing game states
@@ -111,11 +176,11 @@ class MinimaxGPTAgent(GPTAgent):
         self.lookahead = lookahead
         self.minimax = ScoreMinimaxAgent(search_depth)
 
-        return super().__init__(model=model, learning_shots=learning_shots, replay=replay, visualize=True)
+        return super().__init__(model=model, learning_shots=learning_shots, replay=replay, visualize=True, stream=stream)
 
-    def query(self, env, legal_actions):
+    def query(self, env, legal_actions, send=None):
         outcomes = self.minimax_outcomes(env, legal_actions)
-        return gpt_query.minimax_query(self.model, env, outcomes, self.learning_shots, self.replay)
+        return gpt_query.minimax_query(self.model, env, outcomes, self.learning_shots, self.replay, send=send)
 
     def minimax_outcomes(self, env, legal_actions):
         outcomes = {}
@@ -137,13 +202,32 @@ class RandomAgent(ReversiAgent):
     def policy(self, legal_actions, env, _):
         return random.choice(list(legal_actions))
 
+def batch_for(batch_heuristic, env):
+    '''
+    batch_heuristic if it's worth using on env. Bitboard positions are quicker to score one at a
+    time than to turn into NumPy boards.
+    '''
+    if isinstance(env, BitboardEnvironment):
+        return None
+    return batch_heuristic
+
 class HeuristicAgent(ReversiAgent):
+    # Optional batch version of heuristic (see batch_eval), used to score all moves in one call
+    batch_heuristic = None
+
     def policy(self, legal_actions, env, _):
         best_score = -float('inf')
         player = env.curr_player
-        for action in legal_actions:
-            test_env, _, _ = env.act(action)
-            score = self.heuristic(test_env) * player
+        batch_heuristic = batch_for(self.batch_heuristic, env)
+        batch_scores = None
+        if batch_heuristic is not None:
+            batch_scores = batch_heuristic(child_boards(env, list(legal_actions))).tolist()
+        for i, action in enumerate(legal_actions):
+            if batch_scores is not None:
+                score = batch_scores[i] * player
+            else:
+                test_env, _, _ = env.act(action)
+                score = self.heuristic(test_env) * player
             if score > best_score:
                 best_score = score
                 best_actions = []
@@ -155,11 +239,110 @@ class HeuristicAgent(ReversiAgent):
         pass
 
 class MinimaxAgent(HeuristicAgent):
-    def __init__(self, search_depth):
+    def __init__(self, search_depth, table_size=None, time_budget=None, move_ordering=False, pvs=True, aspiration_window=None, workers=None, endgame_empties=None, endgame_wld=False, collect_stats=False):
+        '''
+        table_size: if set, keep a transposition table with this many slots. It is shared by every
+        root move and kept from one turn to the next.
+        time_budget: if set, seconds allowed per move. The agent searches depth 0, 1, 2, ... up to
+        search_depth (or to the end of the game if search_depth is None) and plays the best move
+        of the deepest search that finished in time.
+        move_ordering: order moves by killer/history/corner-first heuristics. Always on when a
+        time_budget is given.
+        pvs: use principal variation search at the root. Does not change the result.
+        aspiration_window: with a time_budget, search each iteration in a window of this half-width
+        around the previous iteration's value first.
+        workers: if set, split root moves across a process pool of this size. The pool is shared by
+        every agent with the same number of workers and lives until the process exits. Workers do
+        not use the transposition table. Not compatible with time_budget.
+        endgame_empties: once this few squares are empty, play perfectly using the endgame solver
+        instead of searching with leaf_heuristic.
+        endgame_wld: have the endgame solver only distinguish win/draw/loss, which is faster but
+        doesn't try to maximise the margin.
+        collect_stats: count nodes, cutoffs, leaf evaluations and legal_actions calls for each move
+        (see move_stats). Searches in parallel workers and the endgame solver are not counted.
+        '''
+        if workers and time_budget is not None:
+            raise ValueError("Parallel search does not support a time budget")
+        if search_depth is None and time_budget is None:
+            raise ValueError("search_depth may only be None when a time_budget is given")
         self.search_depth = search_depth
+        self.table = TranspositionTable(table_size) if table_size else None
+        self.time_budget = time_budget
+        self.ordering = MoveOrderer() if move_ordering or time_budget is not None else None
+        self.pvs = pvs
+        self.aspiration_window = aspiration_window
+        self.workers = workers
+        self.endgame_empties = endgame_empties
+        self.endgame_wld = endgame_wld
+        self.collect_stats = collect_stats
+        self.last_stats = None
+
+    def __getstate__(self):
+        # Copies sent to worker processes only need the heuristic, not the search caches
+        state = self.__dict__.copy()
+        state['table'] = None
+        return state
+
+    def policy(self, legal_actions, env, prev_env):
+        if self.table is not None:
+            self.table.new_search()
+        if self.ordering is not None:
+            self.ordering.new_search()
+        if self.collect_stats:
+            self.last_stats = SearchStats()
+        root = env.copy()
+        empties = env.dim * env.dim - sum(env.get_score().values())
+        if self.endgame_empties is not None and empties <= self.endgame_empties:
+            _, best_actions = solve_root(root, list(legal_actions), self.endgame_wld)
+        elif self.time_budget is not None:
+            best_actions = self.iterative_deepening(legal_actions, root)
+        elif self.workers:
+            pool = get_pool(self.workers)
+            _, best_actions = parallel_root_search(root, self.search_depth + 1, self.leaf_heuristic, pool, list(legal_actions), self.ordering is not None, batch_for(self.batch_leaf_heuristic, root))
+        else:
+            # Children are searched to search_depth, as in HeuristicAgent.policy
+            _, best_actions = self.root_search(root, self.search_depth + 1, list(legal_actions))
+        # Break ties the same way HeuristicAgent does: in legal_actions order
+        return random.choice([a for a in legal_actions if a in best_actions])
+
+    # Optional batch version of leaf_heuristic, used for the leaves below depth 1 nodes
+    batch_leaf_heuristic = None
 
     def heuristic(self, env):
-        return alphabeta(env, self.search_depth, -float('inf'), float('inf'), self.leaf_heuristic)
+        return alphabeta(env, self.search_depth, -float('inf'), float('inf'), self.leaf_heuristic, self.table, self.ordering, 1, stats=self.last_stats, batch_heuristic=batch_for(self.batch_leaf_heuristic, env))
+
+    def move_stats(self, player):
+        if self.last_stats is None:
+            return None
+        return self.last_stats.as_dict()
+
+    def root_search(self, env, depth, actions, deadline=None, guess=None):
+        kwargs = {'actions': actions, 'table': self.table, 'ordering': self.ordering, 'deadline': deadline, 'pvs': self.pvs, 'stats': self.last_stats, 'batch_heuristic': batch_for(self.batch_leaf_heuristic, env)}
+        if guess is not None and self.aspiration_window:
+            return aspiration_search(env, depth, self.leaf_heuristic, guess, self.aspiration_window, **kwargs)
+        return root_search(env, depth, self.leaf_heuristic, **kwargs)
+
+    def iterative_deepening(self, legal_actions, env):
+        deadline = time.perf_counter() + self.time_budget
+        # No point searching deeper than the number of moves left to play
+        max_depth = env.dim * env.dim - sum(env.get_score().values())
+        if self.search_depth is not None:
+            max_depth = min(max_depth, self.search_depth)
+
+        actions = self.ordering.order(legal_actions, 0, env.curr_player, env.dim)
+        best_actions = None
+        value = None
+        for depth in range(max_depth + 1):
+            try:
+                # The shallowest search always completes so there is a move to return
+                value, best_actions = self.root_search(env, depth + 1, actions, deadline if best_actions else None, value)
+            except SearchTimeout:
+                break
+            # Previous iteration's best moves go first in the next one
+            actions = best_actions + [a for a in actions if a not in best_actions]
+            if time.perf_counter() > deadline:
+                break
+        return best_actions
 
     def leaf_heuristic(self, env):
         pass
@@ -170,13 +353,39 @@ class ScoreHeuristicAgent(HeuristicAgent):
         return (s[BLACK] - s[WHITE]) / (s[BLACK] + s[WHITE])
 
 class ScoreGreedyAgent(ScoreHeuristicAgent):
+    batch_heuristic = staticmethod(disc_difference)
+
     def heuristic(self, env):
         return self.score(env)
 
 class ScoreMinimaxAgent(ScoreHeuristicAgent, MinimaxAgent):
+    batch_leaf_heuristic = staticmethod(disc_difference)
+
     def leaf_heuristic(self, env):
         return self.score(env)
 
+class PatternMinimaxAgent(MinimaxAgent):
+    def __init__(self, search_depth, weights_file=None, mobility=True, **kwargs):
+        '''
+        Evaluates leaves with a PatternEvaluator.
+        weights_file: weight tables saved with PatternEvaluator.save. The default weights are used
+        otherwise.
+        mobility: as for PatternEvaluator. Turning it off makes leaves much cheaper to evaluate.
+        Other arguments are as for MinimaxAgent.
+        '''
+        super().__init__(search_depth, **kwargs)
+        self.evaluators = {}
+        self.mobility = mobility
+        if weights_file is not None:
+            evaluator = PatternEvaluator.load(weights_file, mobility)
+            self.evaluators[evaluator.dim] = evaluator
+
+    def leaf_heuristic(self, env):
+        evaluator = self.evaluators.get(env.dim)
+        if evaluator is None:
+            evaluator = self.evaluators[env.dim] = PatternEvaluator(env.dim, mobility=self.mobility)
+        return evaluator.evaluate(env)
+
 
 class DualAgent(ReversiAgent):
     def __init__(self, agent_b, agent_w):
@@ -186,3 +395,32 @@ class DualAgent(ReversiAgent):
 
     def policy(self, legal_actions, env, prev_env):
         return self.agents[env.curr_player].policy(legal_actions, env, prev_env)
+
+    def move_stats(self, player):
+        return self.agents[player].move_stats(player)
+
+class BookAgent(ReversiAgent):
+    def __init__(self, agent, book, min_games=1, choice='best'):
+        '''
+        Plays from an opening book while the position is in it, and lets agent choose once it isn't.
+        book: an OpeningBook, or the path of one saved with OpeningBook.save
+        min_games, choice: as for OpeningBook.choose
+        '''
+        self.agent = agent
+        self.book = OpeningBook.load(book) if isinstance(book, str) else book
+        self.min_games = min_games
+        self.choice = choice
+        self.in_book = {BLACK: False, WHITE: False}
+
+    def policy(self, legal_actions, env, prev_env):
+        action = self.book.choose(env, self.min_games, self.choice)
+        self.in_book[env.curr_player] = action in legal_actions
+        if self.in_book[env.curr_player]:
+            return action
+        return self.agent.policy(legal_actions, env, prev_env)
+
+    def move_stats(self, player):
+        # Book moves involve no search
+        if self.in_book[player]:
+            return None
+        return self.agent.move_stats(player)
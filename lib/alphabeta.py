@@ -1,36 +1,199 @@
+import time
+
+from .batch_eval import child_boards
 from .constants import BLACK
+from .transposition import EXACT, LOWER, UPPER
+
+class SearchTimeout(Exception):
+    pass
 
-def alphabeta(state, depth, alpha, beta, heuristic):
+def alphabeta(state, depth, alpha, beta, heuristic, table=None, ordering=None, ply=0, deadline=None, stats=None, batch_heuristic=None):
+    '''
+    Searches by making and unmaking moves on state in place, so state is unchanged on return.
+    heuristic must not hold on to the state it is given.
+
+    table: optional TranspositionTable. Results are stored under state.zobrist along with the
+    bound they represent, and a stored best move is searched first.
+    ordering: optional MoveOrderer. Beta cutoffs are reported to it as killer/history moves.
+    ply: distance from the root, used to index killer moves.
+    deadline: optional time.perf_counter() value. SearchTimeout is raised once it has passed.
+    stats: optional SearchStats to count nodes, cutoffs, leaf evaluations and legal_actions calls in.
+    batch_heuristic: optional batch version of heuristic (see batch_eval). At depth 1 every child
+    is then scored in one call instead of one heuristic call each. Must agree with heuristic.
+    '''
+    if deadline is not None and time.perf_counter() > deadline:
+        raise SearchTimeout()
+    if stats is not None:
+        stats.nodes += 1
+        if depth == 0:
+            stats.leaf_evals += 1
+        else:
+            stats.legal_actions_calls += 1
     if depth == 0:
         return heuristic(state)
 
-    legal_actions = state.legal_actions()
+    # In the environment's own move format (single bits for BitboardEnvironment), which do_move,
+    # the transposition table and the move orderer all accept
+    legal_actions = state.search_moves()
     if not legal_actions:
         legal_actions = [None]
 
+    hint = None
+    if table is not None:
+        entry = table.lookup(state.zobrist)
+        if entry is not None:
+            if entry.depth >= depth:
+                if entry.flag == EXACT:
+                    return entry.value
+                if entry.flag == LOWER and entry.value > beta:
+                    return entry.value
+                if entry.flag == UPPER and entry.value < alpha:
+                    return entry.value
+            hint = entry.best_move
+    if ordering is not None:
+        legal_actions = ordering.order(legal_actions, ply, state.curr_player, state.dim, hint)
+    elif hint in legal_actions:
+        legal_actions = [hint] + [a for a in legal_actions if a != hint]
+    orig_alpha, orig_beta = alpha, beta
+    best_action = None
+
+    # Children of a pass can end the game, so those are still searched one at a time
+    child_values = None
+    if depth == 1 and batch_heuristic is not None and None not in legal_actions:
+        child_values = batch_heuristic(child_boards(state, legal_actions)).tolist()
+        if stats is not None:
+            stats.nodes += len(child_values)
+            stats.leaf_evals += len(child_values)
+
     if state.curr_player == BLACK:
         value = -float('inf')
-        for action in legal_actions:
-            child, reward, game_over = state.act(action)
-            if game_over:
-                new_value = reward
+        for i, action in enumerate(legal_actions):
+            if child_values is not None:
+                new_value = child_values[i]
             else:
-                new_value = alphabeta(child, depth - 1, alpha, beta, heuristic)
-            value = max(value, new_value)
+                undo, reward, game_over = state.do_move(action)
+                try:
+                    if game_over:
+                        new_value = reward
+                    else:
+                        new_value = alphabeta(state, depth - 1, alpha, beta, heuristic, table, ordering, ply + 1, deadline, stats, batch_heuristic)
+                finally:
+                    state.undo_move(undo)
+            if new_value > value:
+                value = new_value
+                best_action = action
             if value > beta:
+                if stats is not None:
+                    stats.cutoffs += 1
+                if ordering is not None:
+                    ordering.record_cutoff(action, ply, BLACK, depth)
                 break
             alpha = max(alpha, value)
-        return value
     else:
         value = float('inf')
-        for action in legal_actions:
-            child, reward, game_over = state.act(action)
-            if game_over:
-                new_value = reward
+        for i, action in enumerate(legal_actions):
+            if child_values is not None:
+                new_value = child_values[i]
             else:
-                new_value = alphabeta(child, depth - 1, alpha, beta, heuristic)
-            value = min(value, new_value)
+                undo, reward, game_over = state.do_move(action)
+                try:
+                    if game_over:
+                        new_value = reward
+                    else:
+                        new_value = alphabeta(state, depth - 1, alpha, beta, heuristic, table, ordering, ply + 1, deadline, stats, batch_heuristic)
+                finally:
+                    state.undo_move(undo)
+            if new_value < value:
+                value = new_value
+                best_action = action
             if value < alpha:
+                if stats is not None:
+                    stats.cutoffs += 1
+                if ordering is not None:
+                    ordering.record_cutoff(action, ply, state.curr_player, depth)
                 break
             beta = min(beta, value)
-        return value
+
+    if table is not None:
+        # Windows are closed: a value equal to either bound is still exact
+        if value > orig_beta:
+            flag = LOWER
+        elif value < orig_alpha:
+            flag = UPPER
+        else:
+            flag = EXACT
+        table.store(state.zobrist, depth, value, flag, best_action)
+    return value
+
+def root_search(state, depth, heuristic, actions=None, alpha=-float('inf'), beta=float('inf'), table=None, ordering=None, deadline=None, pvs=True, stats=None, batch_heuristic=None):
+    '''
+    Searches every root move of state to the given depth (so each child gets depth - 1) while
+    passing the best score so far on to later siblings as a bound.
+    Returns (value, best actions). value is from BLACK's point of view like alphabeta's. Best
+    actions are all the actions that tie for value, in the order they were searched; ties are
+    always exact because windows are closed.
+
+    actions: root moves in the order to search them. Defaults to state.legal_actions().
+    alpha, beta: root window. If value falls outside it the search failed and must be repeated
+        with a wider window (see aspiration_search).
+    pvs: search moves after the first with a null window first, and only re-search those that
+        beat it.
+    stats: optional SearchStats, as for alphabeta. The root counts as a node.
+    batch_heuristic: as for alphabeta
+    '''
+    if stats is not None:
+        stats.nodes += 1
+    if actions is None:
+        if stats is not None:
+            stats.legal_actions_calls += 1
+        actions = list(state.legal_actions()) or [None]
+    sign = 1 if state.curr_player == BLACK else -1
+    # Work in the mover's point of view; child searches convert back
+    if sign == 1:
+        low, high = alpha, beta
+    else:
+        low, high = -beta, -alpha
+
+    def child_value(child_low, child_high):
+        if sign == 1:
+            return alphabeta(state, depth - 1, child_low, child_high, heuristic, table, ordering, 1, deadline, stats, batch_heuristic)
+        return -alphabeta(state, depth - 1, -child_high, -child_low, heuristic, table, ordering, 1, deadline, stats, batch_heuristic)
+
+    best = -float('inf')
+    best_actions = []
+    for action in actions:
+        undo, reward, game_over = state.do_move(action)
+        try:
+            if game_over:
+                value = reward * sign
+            else:
+                floor = max(low, best)
+                if pvs and best_actions:
+                    value = child_value(floor, floor)
+                    if value > floor:
+                        value = child_value(floor, high)
+                else:
+                    value = child_value(floor, high)
+        finally:
+            state.undo_move(undo)
+        if value > best:
+            best = value
+            best_actions = [action]
+        elif value == best:
+            best_actions.append(action)
+        if best > high:
+            if stats is not None:
+                stats.cutoffs += 1
+            break
+    return (best * sign, best_actions)
+
+def aspiration_search(state, depth, heuristic, guess, window, **kwargs):
+    '''
+    root_search with a window of +/- window around guess (typically the previous iteration's
+    value), repeated with a full window if the result falls outside it.
+    '''
+    alpha, beta = guess - window, guess + window
+    value, best_actions = root_search(state, depth, heuristic, alpha=alpha, beta=beta, **kwargs)
+    if alpha <= value <= beta:
+        return (value, best_actions)
+    return root_search(state, depth, heuristic, **kwargs)
@@ -0,0 +1,130 @@
+import asyncio
+import functools
+import time
+
+from .agents import GPTAgent
+from .constants import BLACK, WHITE
+from .gpt_query import aquery, request_owner
+from .reversi_game import ReversiGame
+
+class AsyncReversiAgent(object):
+    '''
+    Async counterpart of ReversiAgent: choose_action is a coroutine
+    '''
+    async def choose_action(self, env, prev_env):
+        legal_actions = env.legal_actions()
+        if not legal_actions:
+            return self.forced_pass(env)
+        return await self.policy(legal_actions, env, prev_env)
+
+    def forced_pass(self, env):
+        return None
+
+    async def policy(self, legal_actions, env, prev_env):
+        raise NotImplementedError()
+
+    def move_stats(self, player):
+        return None
+
+class AsyncGPTAgent(AsyncReversiAgent):
+    '''
+    Runs a GPTAgent (or subclass) with non-blocking API calls. Prompt building and parsing are
+    the wrapped agent's own.
+    '''
+    def __init__(self, agent):
+        self.agent = agent
+
+    def forced_pass(self, env):
+        return self.agent.forced_pass(env)
+
+    async def policy(self, legal_actions, env, prev_env):
+        if len(legal_actions) == 1:
+            print(f"Single legal action - no query sent")
+            return list(legal_actions)[0]
+        # Building a prompt can involve search (MinimaxGPTAgent looks a move ahead for every legal
+        # move), so do it off the event loop. With aquery as send, query returns the request as a
+        # coroutine to await here.
+        loop = asyncio.get_running_loop()
+        query = functools.partial(self.agent.query, env, legal_actions, send=self.agent.sender(legal_actions, aquery))
+        response = await (await loop.run_in_executor(None, query))
+        return self.agent.response_move(response, legal_actions)
+
+class ExecutorAgent(AsyncReversiAgent):
+    '''
+    Runs a synchronous agent such as ScoreMinimaxAgent in an executor so that it doesn't block
+    other games. executor=None uses the event loop's default thread pool, which keeps the event
+    loop responsive but runs CPU-bound agents one at a time because of the GIL. Pass a
+    ProcessPoolExecutor to search in parallel; the agent is then pickled for every move and its
+    move_stats aren't available.
+    '''
+    def __init__(self, agent, executor=None):
+        self.agent = agent
+        self.executor = executor
+
+    async def choose_action(self, env, prev_env):
+        loop = asyncio.get_running_loop()
+        return await loop.run_in_executor(self.executor, self.agent.choose_action, env, prev_env)
+
+    def move_stats(self, player):
+        # Only available when the agent ran in this process
+        return self.agent.move_stats(player)
+
+def as_async(agent, executor=None):
+    if isinstance(agent, AsyncReversiAgent):
+        return agent
+    if isinstance(agent, GPTAgent):
+        return AsyncGPTAgent(agent)
+    return ExecutorAgent(agent, executor)
+
+class AsyncDualAgent(AsyncReversiAgent):
+    '''
+    executor: where synchronous agents are run, as for ExecutorAgent
+    '''
+    def __init__(self, agent_b, agent_w, executor=None):
+        self.agents = {BLACK: as_async(agent_b, executor), WHITE: as_async(agent_w, executor)}
+        self.agent_b = self.agents[BLACK]
+        self.agent_w = self.agents[WHITE]
+
+    async def choose_action(self, env, prev_env):
+        return await self.agents[env.curr_player].choose_action(env, prev_env)
+
+    def move_stats(self, player):
+        return self.agents[player].move_stats(player)
+
+class AsyncReversiGame(ReversiGame):
+    '''
+    ReversiGame whose agent is an AsyncReversiAgent (usually an AsyncDualAgent)
+    '''
+    async def play(self):
+        # Requests from this game are scheduled fairly against other games' (see gpt_query)
+        request_owner.set(id(self))
+        while(True):
+            if self.verbose:
+                print(f"Turn {self.turn}")
+            if not self.headless:
+                self.print_score()
+            if self.instrument:
+                player = self.env.curr_player
+                start = time.perf_counter()
+            action = await self.agent.choose_action(self.env, self.prev_env)
+            if self.instrument:
+                self.record_stats(player, action, time.perf_counter() - start)
+            self.prev_env = self.env
+            self.env, reward, game_over = self.env.act(action)
+            self.record['actions'].append((action, reward))
+            if game_over:
+                self.game_over(reward)
+                return reward
+            self.turn += 1
+
+async def play_games(games, concurrency=16):
+    '''
+    Plays AsyncReversiGames with at most `concurrency` of them in progress at once.
+    Returns each game's result in order, or the exception that ended it.
+    '''
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def play(game):
+        async with semaphore:
+            return await game.play()
+    return await asyncio.gather(*[play(game) for game in games], return_exceptions=True)
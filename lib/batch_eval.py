@@ -0,0 +1,75 @@
+import functools
+
+import numpy as np
+
+from .constants import BLACK, WHITE
+from .move_ordering import static_weights
+from .vector_environment import legal_moves
+
+# A batch heuristic takes a stack of boards (N, dim, dim) and returns N values from BLACK's point
+# of view, like a scalar heuristic applied to each board in turn.
+
+def child_boards(state, actions):
+    '''
+    Boards after each of actions (none of which may be a pass) is played in state, stacked into one
+    (len(actions), dim, dim) array without making any of the moves
+    '''
+    board = np.asarray(state.board)
+    children = np.repeat(board[None], len(actions), axis=0)
+    idx = []
+    rows = []
+    cols = []
+    for i, action in enumerate(actions):
+        squares = [action]
+        for _, flips in state.check_flips(action):
+            squares += flips
+        idx += [i] * len(squares)
+        for row, col in squares:
+            rows.append(row)
+            cols.append(col)
+    children[idx, rows, cols] = state.curr_player
+    return children
+
+def disc_difference(boards):
+    '''
+    (black - white) / (black + white), as ScoreHeuristicAgent.score
+    '''
+    black = (boards == BLACK).sum(axis=(1, 2))
+    white = (boards == WHITE).sum(axis=(1, 2))
+    return (black - white) / (black + white)
+
+def mobility(boards):
+    '''
+    Difference in the number of moves available to each player, scaled into [-1, 1]
+    '''
+    black = boards == BLACK
+    white = boards == WHITE
+    black_moves = legal_moves(black, white).sum(axis=(1, 2))
+    white_moves = legal_moves(white, black).sum(axis=(1, 2))
+    return (black_moves - white_moves) / np.maximum(black_moves + white_moves, 1)
+
+@functools.lru_cache(maxsize=None)
+def weight_matrix(dim):
+    weights = static_weights(dim)
+    matrix = np.array([[weights[(row, col)] for col in range(dim)] for row in range(dim)], dtype=float)
+    return matrix / np.abs(matrix).sum()
+
+def positional(boards):
+    '''
+    Sum of move_ordering.static_weights over each player's pieces, scaled into [-1, 1]
+    '''
+    return np.tensordot(boards, weight_matrix(boards.shape[1]), axes=([1, 2], [0, 1]))
+
+class WeightedBatchHeuristic(object):
+    '''
+    Weighted sum of batch heuristics, e.g. WeightedBatchHeuristic({disc_difference: 1, mobility: 0.5}).
+    Picklable as long as the heuristics are module-level functions.
+    '''
+    def __init__(self, weights):
+        self.weights = weights
+
+    def __call__(self, boards):
+        values = np.zeros(len(boards))
+        for heuristic, weight in self.weights.items():
+            values += weight * heuristic(boards)
+        return values
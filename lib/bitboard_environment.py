@@ -0,0 +1,355 @@
+import functools
+
+import numpy as np
+
+from .constants import BLACK, WHITE, PLAYER
+from .display_board import board2str
+from .geometry import DIRECTIONS, directed_rays, rays
+from .reversi_environment import UndoRecord
+from .zobrist import zobrist_hash, zobrist_keys
+
+if hasattr(int, 'bit_count'):
+    popcount = int.bit_count
+else:
+    def popcount(x):
+        return bin(x).count('1')
+
+@functools.lru_cache(maxsize=None)
+def geometry(dim):
+    '''
+    Returns (full mask, list of (shift, mask) per direction, rays) for a dim-by-dim board.
+    Square (row, col) is bit row*dim + col. Shifting by `shift` moves every piece one step in a
+    direction; `mask` clears the bits that wrapped around an edge. rays[idx] is geometry.rays with
+    each square as its single bit.
+    '''
+    full = (1 << (dim * dim)) - 1
+    not_first_col = 0
+    not_last_col = 0
+    for row in range(dim):
+        for col in range(dim):
+            bit = 1 << (row * dim + col)
+            if col != 0:
+                not_first_col |= bit
+            if col != dim - 1:
+                not_last_col |= bit
+
+    directions = []
+    for dr, dc in DIRECTIONS:
+        mask = full
+        if dc == 1:
+            mask &= not_first_col
+        elif dc == -1:
+            mask &= not_last_col
+        directions.append((dr * dim + dc, mask))
+
+    bit_rays = [tuple(tuple(1 << idx for idx in ray) for ray in square_rays) for square_rays in rays(dim)]
+    return full, directions, bit_rays
+
+def shift(x, amount, mask):
+    if amount > 0:
+        return (x << amount) & mask
+    return (x >> -amount) & mask
+
+def moves_mask(own, opp, dim):
+    '''
+    Bitmask of squares where the owner of `own` may legally play
+    '''
+    full, directions, _ = geometry(dim)
+    empty = full & ~(own | opp)
+    moves = 0
+    for amount, mask in directions:
+        # Only opponent pieces that survive the edge mask can extend a run. Each pass moves the
+        # runs one step further, marking the square past them, until no run can go on.
+        inner = opp & mask
+        if amount > 0:
+            run = (own << amount) & inner
+            while run:
+                run <<= amount
+                moves |= run & mask
+                run &= inner
+        else:
+            amount = -amount
+            run = (own >> amount) & inner
+            while run:
+                run >>= amount
+                moves |= run & mask
+                run &= inner
+    return moves & empty
+
+@functools.lru_cache(maxsize=None)
+def square_directions(dim):
+    '''
+    square_directions(dim)[idx] is (up, down): the directions in which a move on square idx could
+    flip anything (those with at least two squares to walk), as (shift, mask) pairs from geometry.
+    up holds those that shift left, down those that shift right, with the shift made positive.
+    '''
+    directions = geometry(dim)[1]
+    table = []
+    for square_rays in directed_rays(dim):
+        steps = [directions[direction] for direction, _ in square_rays]
+        table.append((tuple((amount, mask) for amount, mask in steps if amount > 0), tuple((-amount, mask) for amount, mask in steps if amount < 0)))
+    return tuple(table)
+
+def flips_mask(move, own, opp, dim):
+    '''
+    Bitmask of opponent pieces flipped by the owner of `own` playing the single-bit `move`. Each
+    direction is flooded with shifts from the move across opponent pieces, and the run is kept if
+    it ends against one of own.
+    '''
+    flips = 0
+    up, down = square_directions(dim)[move.bit_length() - 1]
+    # The first step never wraps, since only directions with room for a line are listed
+    for amount, mask in up:
+        x = move << amount
+        if x & opp:
+            run = 0
+            while x & opp:
+                run |= x
+                x = (x << amount) & mask
+            if x & own:
+                flips |= run
+    for amount, mask in down:
+        x = move >> amount
+        if x & opp:
+            run = 0
+            while x & opp:
+                run |= x
+                x = (x >> amount) & mask
+            if x & own:
+                flips |= run
+    return flips
+
+def bits(mask):
+    '''
+    Yields the index of every set bit in mask, lowest first
+    '''
+    while mask:
+        low = mask & -mask
+        yield low.bit_length() - 1
+        mask ^= low
+
+def action2bit(action, dim):
+    row, col = action
+    return 1 << (int(row) * dim + int(col))
+
+def board2bits(board):
+    '''
+    Converts a NumPy board into (black mask, white mask)
+    '''
+    flat = np.asarray(board).ravel()
+    # Bit i of each mask is square i, so pack least significant bit first
+    black = int.from_bytes(np.packbits(flat == BLACK, bitorder='little').tobytes(), 'little')
+    white = int.from_bytes(np.packbits(flat == WHITE, bitorder='little').tobytes(), 'little')
+    return black, white
+
+class BitboardEnvironment(object):
+    '''
+    Drop-in replacement for ReversiEnvironment which stores each position as two integer masks
+    (one per player) instead of a NumPy array. For an 8x8 board each mask fits in 64 bits.
+    '''
+    __slots__ = ('dim', 'black', 'white', 'curr_player', 'last_moved', 'zobrist', '_moves', '_legal')
+
+    def __init__(self, dim, black=None, white=None, curr_player=BLACK, last_moved=True, zobrist=None):
+        self.dim = dim
+        self.black = black
+        self.white = white
+        if self.black is None or self.white is None:
+            self.init_board()
+
+        self.curr_player = curr_player
+        self.last_moved = last_moved
+        self.zobrist = zobrist
+        if self.zobrist is None:
+            self.zobrist = zobrist_hash(self.board, curr_player, last_moved)
+
+        # Legal moves as a mask and as a set, computed when first needed
+        self._moves = None
+        self._legal = None
+
+    @classmethod
+    def from_environment(cls, env):
+        black, white = board2bits(env.board)
+        return cls(env.dim, black, white, env.curr_player, env.last_moved, env.zobrist)
+
+    def init_board(self):
+        if self.dim % 2 != 0:
+            raise ValueError("Dimensions must be even")
+        elif self.dim < 4:
+            raise ValueError("Dimensions must be >= 4")
+        half = self.dim // 2
+        self.black = (1 << ((half - 1) * self.dim + half)) | (1 << (half * self.dim + half - 1))
+        self.white = (1 << ((half - 1) * self.dim + half - 1)) | (1 << (half * self.dim + half))
+
+    @property
+    def board(self):
+        board = np.zeros(self.dim * self.dim, dtype=int)
+        board[list(bits(self.black))] = BLACK
+        board[list(bits(self.white))] = WHITE
+        return board.reshape((self.dim, self.dim))
+
+    def own_opp(self):
+        if self.curr_player == BLACK:
+            return self.black, self.white
+        return self.white, self.black
+
+    def legal_moves_mask(self):
+        if self._moves is None:
+            own, opp = self.own_opp()
+            self._moves = moves_mask(own, opp, self.dim)
+        return self._moves
+
+    def legal_actions(self):
+        '''
+        The returned set is cached on the position and shared between callers, so must not be modified
+        '''
+        if self._legal is None:
+            dim = self.dim
+            found = set()
+            moves = self.legal_moves_mask()
+            while moves:
+                low = moves & -moves
+                found.add(divmod(low.bit_length() - 1, dim))
+                moves ^= low
+            self._legal = found
+        return self._legal
+
+    def search_moves(self):
+        '''
+        Legal moves as single-bit masks, the form search passes to do_move. Cheaper than
+        legal_actions since no (row, col) tuples are built.
+        '''
+        moves = self.legal_moves_mask()
+        found = []
+        while moves:
+            low = moves & -moves
+            found.append(low)
+            moves ^= low
+        return found
+
+    def act(self, action):
+        '''
+        Returns
+        - New environment
+        - Reward
+        - If game is over
+        '''
+        new_env = self.copy()
+        _, reward, game_over = new_env.do_move(action)
+        return (new_env, reward, game_over)
+
+    def do_move(self, action):
+        '''
+        Plays action on this environment in place. action may be (row, col), a single-bit mask as
+        returned by search_moves, or None to pass. The UndoRecord's action is the move's bit (or
+        None) and its flips a bitmask.
+        Returns
+        - UndoRecord to pass to undo_move
+        - Reward
+        - If game is over
+        '''
+        player = self.curr_player
+        last_moved = self.last_moved
+        zobrist = self.zobrist
+        moves = (self._moves, self._legal)
+        keys = zobrist_keys(self.dim)
+        move = None
+        flips = 0
+        reward = 0
+        game_over = False
+
+        new_zobrist = zobrist ^ keys.side
+        if action is None:
+            self.last_moved = False
+            if last_moved:
+                new_zobrist ^= keys.passed
+            else:
+                game_over = True
+                black, white = popcount(self.black), popcount(self.white)
+                if black > white:
+                    reward = 1
+                elif white > black:
+                    reward = -1
+        else:
+            move = action if action.__class__ is int else action2bit(action, self.dim)
+            if player == BLACK:
+                flips = flips_mask(move, self.black, self.white, self.dim)
+                self.black |= flips | move
+                self.white &= ~flips
+            else:
+                flips = flips_mask(move, self.white, self.black, self.dim)
+                self.white |= flips | move
+                self.black &= ~flips
+            self.last_moved = True
+            if not last_moved:
+                new_zobrist ^= keys.passed
+
+            new_zobrist ^= keys.pieces[player][move.bit_length() - 1]
+            flip_keys = keys.flips
+            remaining = flips
+            while remaining:
+                low = remaining & -remaining
+                new_zobrist ^= flip_keys[low.bit_length() - 1]
+                remaining ^= low
+
+        self.zobrist = new_zobrist
+        self.curr_player = -player
+        self._moves = None
+        self._legal = None
+        # tuple.__new__ skips the namedtuple constructor's Python-level argument handling, which is
+        # a noticeable share of a move this cheap
+        return (tuple.__new__(UndoRecord, (move, flips, player, last_moved, zobrist, moves)), reward, game_over)
+
+    def undo_move(self, undo):
+        '''
+        Reverts the do_move call that returned undo. Moves must be undone in reverse order.
+        '''
+        move = undo.action
+        if move is not None:
+            if undo.curr_player == BLACK:
+                self.black ^= undo.flips | move
+                self.white |= undo.flips
+            else:
+                self.white ^= undo.flips | move
+                self.black |= undo.flips
+        self.curr_player = undo.curr_player
+        self.last_moved = undo.last_moved
+        self.zobrist = undo.zobrist
+        if undo.moves is not None:
+            self._moves, self._legal = undo.moves
+
+    def copy(self):
+        env = BitboardEnvironment(self.dim, self.black, self.white, self.curr_player, self.last_moved, self.zobrist)
+        env._moves = self._moves
+        env._legal = self._legal
+        return env
+
+    def check_flips(self, action):
+        '''
+        Same contract as ReversiEnvironment.check_flips: a list of (anchoring piece, flipped pieces)
+        tuples, one per direction that flips anything.
+        '''
+        if action is None:
+            return []
+
+        dim = self.dim
+        own, opp = self.own_opp()
+        move = action2bit(action, dim)
+        result = []
+        for ray in geometry(dim)[2][move.bit_length() - 1]:
+            potential_flips = []
+            for bit in ray:
+                if bit & opp:
+                    potential_flips.append(divmod(bit.bit_length() - 1, dim))
+                    continue
+                if bit & own and potential_flips:
+                    result.append((divmod(bit.bit_length() - 1, dim), potential_flips))
+                break
+        return result
+
+    def get_score(self):
+        return {BLACK: popcount(self.black), WHITE: popcount(self.white)}
+
+    def __repr__(self):
+        board_str = board2str(self.board)
+        text_str = f"{PLAYER[self.curr_player]}'s turn"
+        return f"{text_str}\n{board_str}"
@@ -0,0 +1,126 @@
+import functools
+
+from .bitboard_environment import action2bit, board2bits, flips_mask, geometry, moves_mask, popcount
+from .constants import BLACK
+
+# Above this many empties, moves are tried fastest-first (fewest opponent replies); below it the
+# cost of counting replies outweighs the pruning and parity ordering alone is used
+FASTEST_FIRST_EMPTIES = 7
+
+@functools.lru_cache(maxsize=None)
+def quadrants(dim):
+    '''
+    Masks for the four quadrants of the board, used for parity ordering
+    '''
+    half = dim // 2
+    masks = [0, 0, 0, 0]
+    for row in range(dim):
+        for col in range(dim):
+            masks[2 * (row >= half) + (col >= half)] |= 1 << (row * dim + col)
+    return masks
+
+def position_masks(env):
+    '''
+    (mover's pieces, opponent's pieces) as bitmasks, for either environment type
+    '''
+    if hasattr(env, 'own_opp'):
+        return env.own_opp()
+    black, white = board2bits(env.board)
+    if env.curr_player == BLACK:
+        return black, white
+    return white, black
+
+def ordered_moves(moves, own, opp, dim):
+    '''
+    Splits the moves mask into single bits, moves in odd-parity quadrants first (the player who
+    moves last in a region usually gains from it), then fastest-first if there are many empties.
+    '''
+    full = geometry(dim)[0]
+    empty = full & ~(own | opp)
+    odd = 0
+    for quadrant in quadrants(dim):
+        if popcount(empty & quadrant) & 1:
+            odd |= quadrant
+
+    result = []
+    while moves:
+        move = moves & -moves
+        result.append(move)
+        moves ^= move
+    if popcount(empty) > FASTEST_FIRST_EMPTIES:
+        def key(move):
+            flips = flips_mask(move, own, opp, dim)
+            return (not move & odd, popcount(moves_mask(opp & ~flips, own | flips | move, dim)))
+    else:
+        def key(move):
+            return not move & odd
+    result.sort(key=key)
+    return result
+
+def negamax(own, opp, alpha, beta, passed, dim):
+    '''
+    Exact final disc differential (own minus opp) with the mover to play, fail-soft within the open
+    window (alpha, beta)
+    '''
+    moves = moves_mask(own, opp, dim)
+    if not moves:
+        if passed:
+            return popcount(own) - popcount(opp)
+        return -negamax(opp, own, -beta, -alpha, True, dim)
+
+    best = -dim * dim - 1
+    for move in ordered_moves(moves, own, opp, dim):
+        flips = flips_mask(move, own, opp, dim)
+        value = -negamax(opp & ~flips, own | flips | move, -beta, -alpha, False, dim)
+        if value > best:
+            best = value
+            if value > alpha:
+                alpha = value
+                if alpha >= beta:
+                    break
+    return best
+
+def solve(env, wld=False):
+    '''
+    Exact outcome of env with perfect play, as the final disc differential from BLACK's point of
+    view. With wld=True only the sign is determined (1, 0 or -1), which solves faster.
+    '''
+    own, opp = position_masks(env)
+    sign = 1 if env.curr_player == BLACK else -1
+    if wld:
+        value = negamax(own, opp, -1, 1, not env.last_moved, env.dim)
+        return sign * ((value > 0) - (value < 0))
+    return sign * negamax(own, opp, -env.dim * env.dim - 1, env.dim * env.dim + 1, not env.last_moved, env.dim)
+
+def solve_root(env, actions, wld=False):
+    '''
+    Returns (value, best actions) like alphabeta.root_search, but with perfect play to the end of
+    the game. value is the disc differential (or its sign if wld) from BLACK's point of view.
+    '''
+    dim = env.dim
+    own, opp = position_masks(env)
+    sign = 1 if env.curr_player == BLACK else -1
+    limit = dim * dim + 1
+
+    best = -limit
+    best_actions = []
+    for action in actions:
+        if action is None:
+            value = -negamax(opp, own, -limit, limit, True, dim) if env.last_moved else popcount(own) - popcount(opp)
+        else:
+            move = action2bit(action, dim)
+            flips = flips_mask(move, own, opp, dim)
+            child_own, child_opp = opp & ~flips, own | flips | move
+            if wld:
+                value = -negamax(child_own, child_opp, -1, 1, False, dim)
+            else:
+                # An open window just below best keeps ties exact
+                value = -negamax(child_own, child_opp, -limit, -(best - 1), False, dim)
+        if wld:
+            value = (value > 0) - (value < 0)
+        if value > best:
+            best = value
+            best_actions = [action]
+        elif value == best:
+            best_actions.append(action)
+    return (best * sign, best_actions)
@@ -0,0 +1,43 @@
+import functools
+
+# The eight directions a line of pieces can run in, as (row step, col step). check_flips lists
+# flips in this order.
+DIRECTIONS = [(0, 1), (0, -1), (1, 0), (1, 1), (1, -1), (-1, 0), (-1, 1), (-1, -1)]
+# Index in DIRECTIONS of the reverse of each direction
+OPPOSITE = [DIRECTIONS.index((-dr, -dc)) for dr, dc in DIRECTIONS]
+
+@functools.lru_cache(maxsize=None)
+def squares(dim):
+    '''
+    (row, col) of every flat square index row * dim + col
+    '''
+    return tuple(divmod(idx, dim) for idx in range(dim * dim))
+
+@functools.lru_cache(maxsize=None)
+def directed_rays(dim):
+    '''
+    directed_rays(dim)[idx] holds (index into DIRECTIONS, ray) for every ray from square idx, where
+    a ray is the flat indices of the squares walked outward from idx. Rays shorter than two squares
+    are left out since nothing can be flipped along them. Computed once per dim and shared by
+    every environment.
+    '''
+    table = []
+    for row, col in squares(dim):
+        square_rays = []
+        for direction, (dr, dc) in enumerate(DIRECTIONS):
+            ray = []
+            r, c = row + dr, col + dc
+            while 0 <= r < dim and 0 <= c < dim:
+                ray.append(r * dim + c)
+                r, c = r + dr, c + dc
+            if len(ray) >= 2:
+                square_rays.append((direction, tuple(ray)))
+        table.append(tuple(square_rays))
+    return tuple(table)
+
+@functools.lru_cache(maxsize=None)
+def rays(dim):
+    '''
+    directed_rays without the directions
+    '''
+    return tuple(tuple(ray for _, ray in square_rays) for square_rays in directed_rays(dim))
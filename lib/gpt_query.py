@@ -1,13 +1,17 @@
+import contextvars
 from dotenv import load_dotenv
 import numpy as np
 import os
 import openai
 import random
+import weakref
 from tenacity import retry, stop_after_attempt, wait_random_exponential
 
 from .constants import PLAYER, BLACK, WHITE
 from .display_board import board2ascii
 from .notation import coords2notation, max_col
+from .rate_limiter import RequestScheduler, estimate_tokens
+from .response_cache import ResponseCache
 
 load_dotenv()
 openai.api_key = os.getenv("OPENAI_API_KEY")
@@ -168,26 +172,45 @@ def example_greedy_visual_conversation(replay, turn):
 
     return (greedy_visual_prompt(env, legal_actions), '\n'.join(resp))
 
-
-def move_query(model, env, legal_moves, shots=0, replay=None, visualize=False):
+# Few-shot example messages per replay, keyed by (builder, turns, builder options). Weakly keyed so
+# that dropping a Replay drops its examples too.
+_few_shot_cache = weakref.WeakKeyDictionary()
+
+def shot_turns(shots):
+    '''
+    The example game turns used for a number of shots
+    '''
+    return tuple(shot*3 + 2 for shot in range(shots))
+
+def few_shot_examples(replay, builder, turns, *options):
+    '''
+    The conversation messages builder(replay, turn, *options) produces for each of turns,
+    concatenated. Built once per replay and reused by every agent and game afterwards.
+    '''
+    if not turns:
+        return []
+    examples = _few_shot_cache.setdefault(replay, {})
+    key = (builder.__name__, turns, options)
+    if key not in examples:
+        messages = []
+        for turn in turns:
+            messages += builder(replay, turn, *options)
+        examples[key] = tuple(messages)
+    return list(examples[key])
+
+def move_query(model, env, legal_moves, shots=0, replay=None, visualize=False, send=None):
     prompt = preamble(env)
-    messages = []
-    for shot in range(shots):
-        turn = shot*3 + 2
-        messages += example_move_conversation(replay, turn, visualize)
+    messages = few_shot_examples(replay, example_move_conversation, shot_turns(shots), visualize)
     messages.append(move_prompt(env, legal_moves, visualize))
-    return query(model, prompt, messages)
+    return (send or query)(model, prompt, messages)
 
-def legal_query(model, env, shots=0, replay=None, visualize=False):
+def legal_query(model, env, shots=0, replay=None, visualize=False, send=None):
     prompt = preamble(env)
-    messages = []
-    for shot in range(shots):
-        turn = shot*3 + 2
-        messages += example_legal_conversation(replay, turn, visualize)
+    messages = few_shot_examples(replay, example_legal_conversation, shot_turns(shots), visualize)
     messages.append(legal_prompt(env, visualize))
-    return query(model, prompt, messages, max_tokens=300)
+    return (send or query)(model, prompt, messages, max_tokens=300)
 
-def accurate_move_query(model, replay, turn, shots=0, example_replay=None):
+def accurate_move_query(model, replay, turn, shots=0, example_replay=None, send=None):
     prompt = preamble(replay.state_before_turn(turn))
     messages = []
     ex_turns = []
@@ -200,37 +223,30 @@ def accurate_move_query(model, replay, turn, shots=0, example_replay=None):
             if ex_action is not None:
                 break
         ex_turns.append(ex_turn)
-        messages += example_accurate_move_prompt_conversation(example_replay, ex_turn)
+        messages += few_shot_examples(example_replay, example_accurate_move_prompt_conversation, (ex_turn,))
     messages.append(accurate_move_prompt(replay.state_before_turn(turn), replay.get_action(turn)))
-    return query(model, prompt, messages, max_tokens=150, strip=False)
+    return (send or query)(model, prompt, messages, max_tokens=150, strip=False)
 
-def greedy_query(model, env, legal_moves, shots=0, replay=None, visualize=False):
+def greedy_query(model, env, legal_moves, shots=0, replay=None, visualize=False, send=None):
     prompt = preamble(env)
-    messages = []
-    for shot in range(shots):
-        turn = shot*3 + 2
-        messages += example_greedy_conversation(replay, turn, visualize)
+    messages = few_shot_examples(replay, example_greedy_conversation, shot_turns(shots), visualize)
     messages.append(greedy_prompt(env, legal_moves, visualize))
-    return query(model, prompt, messages, max_tokens=1000)
+    return (send or query)(model, prompt, messages, max_tokens=1000)
 
-def greedy_visual_query(model, env, legal_moves, shots=0, replay=None):
+def greedy_visual_query(model, env, legal_moves, shots=0, replay=None, send=None):
     prompt = preamble(env)
-    messages = []
-    for shot in range(shots):
-        turn = shot*3 + 2
-        messages += example_greedy_visual_conversation(replay, turn)
+    messages = few_shot_examples(replay, example_greedy_visual_conversation, shot_turns(shots))
     messages.append(greedy_visual_prompt(env, legal_moves))
-    return query(model, prompt, messages, max_tokens=1000)
+    return (send or query)(model, prompt, messages, max_tokens=1000)
 
-def minimax_query(model, env, moves2outcomes, shots=0, replay=None):
+def minimax_query(model, env, moves2outcomes, shots=0, replay=None, send=None):
     if shots > 0:
         raise NotImplementedError("minimax_query not compatible with few-shot learning")
     prompt = preamble(env)
     messages = [minimax_prompt(env, moves2outcomes)]
-    return query(model, prompt, messages, max_tokens=60)
+    return (send or query)(model, prompt, messages, max_tokens=60)
 
-@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
-def query(model, prompt, conversation, max_tokens=25, strip=True):
+def chat_messages(prompt, conversation):
     messages = [{"role": "system", "content": prompt}]
     for idx, message in enumerate(conversation):
         if idx % 2 == 0:
@@ -242,15 +258,144 @@ def query(model, prompt, conversation, max_tokens=25, strip=True):
             print('\033[34m' + message + '\033[0m')
             print("-----")
         messages.append({"role": role, "content": message})
-    response = openai.ChatCompletion.create(model=model, messages=messages, temperature=0, max_tokens=max_tokens)
+    return messages
 
-    resp = response.choices[0].message.content
+def response_text(resp, strip):
     if strip:
         resp = resp.strip()
     print("-----")
     print('\033[36m' + resp + '\033[0m')
     return resp
 
+def configure_cache(path, max_bytes=256 * 2**20, offline=False):
+    '''
+    Remember responses on disk at path (see ResponseCache). Pass path=None to turn caching off.
+    '''
+    global response_cache
+    response_cache = ResponseCache(path, max_bytes, offline) if path else None
+    return response_cache
+
+# Set GPT_CACHE in '.env' to cache responses there, and GPT_CACHE_OFFLINE=1 to run from it only
+response_cache = None
+configure_cache(os.getenv("GPT_CACHE"), offline=os.getenv("GPT_CACHE_OFFLINE", "") not in ("", "0"))
+
+def cache_lookup(model, messages, max_tokens, stop_when=None):
+    '''
+    Returns (cache key, cached response). The key is None when caching is off and the response is
+    None on a miss.
+    '''
+    if response_cache is None:
+        return (None, None)
+    # A response cut off by stop_when is only valid for the same stopping rule
+    variant = None if stop_when is None else f"stream:{getattr(stop_when, '__qualname__', repr(stop_when))}"
+    key = response_cache.key(model, messages, max_tokens, variant)
+    return (key, response_cache.get(key))
+
+def configure_scheduler(requests_per_minute=None, tokens_per_minute=None):
+    '''
+    Hold requests back to stay within these budgets (see RequestScheduler). With neither set,
+    requests are sent immediately.
+    '''
+    global scheduler
+    if requests_per_minute or tokens_per_minute:
+        scheduler = RequestScheduler(requests_per_minute, tokens_per_minute)
+    else:
+        scheduler = None
+    return scheduler
+
+# Set GPT_RPM and/or GPT_TPM in '.env' to rate limit requests
+scheduler = None
+configure_scheduler(int(os.getenv("GPT_RPM", 0)), int(os.getenv("GPT_TPM", 0)))
+
+# Which game a request belongs to, for fair scheduling. AsyncReversiGame sets it per game.
+request_owner = contextvars.ContextVar('request_owner', default=None)
+
+# Seconds to back off after a 429 that doesn't say how long to wait
+DEFAULT_RETRY_AFTER = 1.0
+
+def note_rate_limit(error):
+    if scheduler is None:
+        return
+    headers = getattr(error, 'headers', None) or {}
+    try:
+        retry_after = float(headers.get('retry-after', DEFAULT_RETRY_AFTER))
+    except ValueError:
+        retry_after = DEFAULT_RETRY_AFTER
+    scheduler.rate_limited_for(retry_after)
+
+def chunk_text(chunk):
+    return chunk.choices[0].delta.get('content', '')
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+def create_completion(model, messages, max_tokens, stop_when=None):
+    '''
+    stop_when: if given, stream the response and stop reading it as soon as stop_when(text so far)
+    is true
+    '''
+    if scheduler is not None:
+        scheduler.acquire(estimate_tokens(messages, max_tokens), request_owner.get())
+    try:
+        response = openai.ChatCompletion.create(model=model, messages=messages, temperature=0, max_tokens=max_tokens, stream=stop_when is not None)
+        if stop_when is None:
+            return response.choices[0].message.content
+        resp = ''
+        for chunk in response:
+            resp += chunk_text(chunk)
+            if stop_when(resp):
+                break
+        if hasattr(response, 'close'):
+            response.close()
+        return resp
+    except openai.error.RateLimitError as e:
+        note_rate_limit(e)
+        raise
+
+@retry(wait=wait_random_exponential(min=1, max=60), stop=stop_after_attempt(6))
+async def acreate_completion(model, messages, max_tokens, stop_when=None):
+    if scheduler is not None:
+        await scheduler.acquire_async(estimate_tokens(messages, max_tokens), request_owner.get())
+    try:
+        response = await openai.ChatCompletion.acreate(model=model, messages=messages, temperature=0, max_tokens=max_tokens, stream=stop_when is not None)
+        if stop_when is None:
+            return response.choices[0].message.content
+        resp = ''
+        async for chunk in response:
+            resp += chunk_text(chunk)
+            if stop_when(resp):
+                break
+        if hasattr(response, 'aclose'):
+            await response.aclose()
+        return resp
+    except openai.error.RateLimitError as e:
+        note_rate_limit(e)
+        raise
+
+def query(model, prompt, conversation, max_tokens=25, strip=True, stop_when=None):
+    '''
+    stop_when: stream the response, returning as soon as stop_when(text so far) is true (e.g. once a
+    move can be parsed from it) rather than waiting for the whole completion
+    '''
+    messages = chat_messages(prompt, conversation)
+    key, resp = cache_lookup(model, messages, max_tokens, stop_when)
+    if resp is None:
+        resp = create_completion(model, messages, max_tokens, stop_when)
+        if key is not None:
+            response_cache.put(key, resp)
+    return response_text(resp, strip)
+
+async def aquery(model, prompt, conversation, max_tokens=25, strip=True, stop_when=None):
+    '''
+    Coroutine version of query. Pass it as `send` to any of the *_query functions to get back an
+    awaitable instead of a response.
+    '''
+    messages = chat_messages(prompt, conversation)
+    key, resp = cache_lookup(model, messages, max_tokens, stop_when)
+    if resp is None:
+        resp = await acreate_completion(model, messages, max_tokens, stop_when)
+        if key is not None:
+            response_cache.put(key, resp)
+    return response_text(resp, strip)
+
 def piece_list(env, player):
     return poslist2str(zip(*np.where(env.board == player)))
 
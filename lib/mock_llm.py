@@ -0,0 +1,154 @@
+import contextlib
+import http.server
+import itertools
+import json
+import random
+import re
+import threading
+import time
+
+import openai
+
+from .notation import extract_all_notation, coords2notation
+
+LEGAL_MOVES = re.compile(r'legal moves: ([a-z0-9, ]+)\.')
+
+def legal_move_response(messages, rng):
+    '''
+    Default canned answer: picks one of the legal moves listed in the last prompt and answers in
+    the shape each kind of prompt asks for
+    '''
+    prompt = messages[-1]['content']
+    match = LEGAL_MOVES.search(prompt)
+    if match is None:
+        return "None"
+    moves = [coords2notation(m) for m in extract_all_notation(match.group(1))]
+    move = rng.choice(moves)
+    if "flips the most pieces" in prompt:
+        explanation = "\n".join(f"For move {m}:\nSo this move flips 1 in total.\n" for m in moves)
+        return f"{explanation}\nSo the best move is {move}."
+    return f"{move}."
+
+class MockChatServer(object):
+    '''
+    Stand-in for the chat completions API on localhost, for benchmarking and testing without a
+    key. Supports streaming.
+
+    latency: seconds to wait before answering each request
+    error_rate: fraction of requests answered with error_status (429 by default) instead
+    responses: a list of canned replies to cycle through, or a function (messages, rng) -> reply.
+        Defaults to legal_move_response.
+    '''
+    def __init__(self, latency=0.0, error_rate=0.0, error_status=429, retry_after=0, responses=None, seed=0):
+        self.latency = latency
+        self.error_rate = error_rate
+        self.error_status = error_status
+        self.retry_after = retry_after
+        if responses is None:
+            responses = legal_move_response
+        elif not callable(responses):
+            replies = itertools.cycle(responses)
+            responses = lambda messages, rng: next(replies)
+        self.responses = responses
+        self.rng = random.Random(seed)
+        self.lock = threading.Lock()
+
+        self.requests = 0
+        self.errors = 0
+        self.httpd = None
+        self.thread = None
+
+    @property
+    def url(self):
+        host, port = self.httpd.server_address[:2]
+        return f"http://{host}:{port}/v1"
+
+    def start(self):
+        server = self
+
+        class Handler(http.server.BaseHTTPRequestHandler):
+            def do_POST(self):
+                length = int(self.headers.get('Content-Length', 0))
+                server.handle(self, json.loads(self.rfile.read(length)))
+
+            def log_message(self, format, *args):
+                pass
+
+        self.httpd = http.server.ThreadingHTTPServer(('127.0.0.1', 0), Handler)
+        self.thread = threading.Thread(target=self.httpd.serve_forever, daemon=True)
+        self.thread.start()
+        return self
+
+    def stop(self):
+        self.httpd.shutdown()
+        self.httpd.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, *exc):
+        self.stop()
+
+    def handle(self, handler, body):
+        with self.lock:
+            self.requests += 1
+            fail = self.rng.random() < self.error_rate
+            if fail:
+                self.errors += 1
+            else:
+                reply = self.responses(body['messages'], self.rng)
+        time.sleep(self.latency)
+
+        if fail:
+            error = {'error': {'message': 'Mock error', 'type': 'rate_limit_error' if self.error_status == 429 else 'server_error'}}
+            self.send_json(handler, self.error_status, error, {'Retry-After': str(self.retry_after)})
+            return
+
+        model = body.get('model', 'mock')
+        if not body.get('stream'):
+            completion = {
+                'id': f'mock-{self.requests}',
+                'object': 'chat.completion',
+                'created': int(time.time()),
+                'model': model,
+                'choices': [{'index': 0, 'message': {'role': 'assistant', 'content': reply}, 'finish_reason': 'stop'}],
+                'usage': {'prompt_tokens': 0, 'completion_tokens': 0, 'total_tokens': 0},
+            }
+            self.send_json(handler, 200, completion)
+            return
+
+        handler.send_response(200)
+        handler.send_header('Content-Type', 'text/event-stream')
+        handler.end_headers()
+        try:
+            # Roughly token-sized pieces
+            for piece in re.findall(r'\s*\S+', reply) or ['']:
+                chunk = {'object': 'chat.completion.chunk', 'model': model, 'choices': [{'index': 0, 'delta': {'content': piece}, 'finish_reason': None}]}
+                handler.wfile.write(f"data: {json.dumps(chunk)}\n\n".encode('utf-8'))
+                handler.wfile.flush()
+            handler.wfile.write(b"data: [DONE]\n\n")
+        except (BrokenPipeError, ConnectionResetError):
+            # The client stopped reading early
+            pass
+
+    def send_json(self, handler, status, body, headers=None):
+        data = json.dumps(body).encode('utf-8')
+        handler.send_response(status)
+        handler.send_header('Content-Type', 'application/json')
+        handler.send_header('Content-Length', str(len(data)))
+        for key, value in (headers or {}).items():
+            handler.send_header(key, value)
+        handler.end_headers()
+        handler.wfile.write(data)
+
+@contextlib.contextmanager
+def use_mock(server):
+    '''
+    Points gpt_query (via the openai module) at server for the duration of the block
+    '''
+    old_base, old_key = openai.api_base, openai.api_key
+    openai.api_base, openai.api_key = server.url, 'mock'
+    try:
+        yield server
+    finally:
+        openai.api_base, openai.api_key = old_base, old_key
@@ -0,0 +1,87 @@
+import collections
+import functools
+
+CORNER = 3
+EDGE = 1
+INTERIOR = 0
+C_SQUARE = -1
+X_SQUARE = -2
+
+@functools.lru_cache(maxsize=None)
+def static_weights(dim):
+    '''
+    Returns {square: weight} favouring corners, then edges, and avoiding the squares next to
+    corners that usually give them away.
+    '''
+    last = dim - 1
+    corners = {(0, 0), (0, last), (last, 0), (last, last)}
+    weights = {}
+    for row in range(dim):
+        for col in range(dim):
+            near_row = min(row, last - row)
+            near_col = min(col, last - col)
+            if (row, col) in corners:
+                weight = CORNER
+            elif near_row == 1 and near_col == 1:
+                weight = X_SQUARE
+            elif (near_row, near_col) in [(0, 1), (1, 0)]:
+                weight = C_SQUARE
+            elif near_row == 0 or near_col == 0:
+                weight = EDGE
+            else:
+                weight = INTERIOR
+            weights[(row, col)] = weight
+    return weights
+
+@functools.lru_cache(maxsize=None)
+def move_weights(dim):
+    '''
+    static_weights keyed by both (row, col) and the square's bit, the two forms moves take in search
+    '''
+    weights = dict(static_weights(dim))
+    for (row, col), weight in static_weights(dim).items():
+        weights[1 << (row * dim + col)] = weight
+    return weights
+
+class MoveOrderer(object):
+    '''
+    Orders moves for alphabeta: a supplied first move (previous iteration or transposition table),
+    then killer moves for the ply, then by static square weight, then by history score.
+    '''
+    def __init__(self, killer_slots=2):
+        self.killer_slots = killer_slots
+        self.killers = collections.defaultdict(list)
+        self.history = collections.defaultdict(int)
+
+    def new_search(self):
+        '''
+        Killers only make sense within one tree. History is kept but decayed.
+        '''
+        self.killers.clear()
+        for key in self.history:
+            self.history[key] //= 2
+
+    def order(self, actions, ply, player, dim, first=None):
+        if len(actions) < 2:
+            return list(actions)
+        killers = self.killers.get(ply, [])
+        weights = move_weights(dim)
+        history = self.history
+
+        def key(action):
+            return (
+                action == first,
+                action in killers,
+                weights[action],
+                history.get((player, action), 0),
+            )
+        return sorted(actions, key=key, reverse=True)
+
+    def record_cutoff(self, action, ply, player, depth):
+        if action is None:
+            return
+        killers = self.killers[ply]
+        if action not in killers:
+            killers.insert(0, action)
+            del killers[self.killer_slots:]
+        self.history[(player, action)] += depth * depth
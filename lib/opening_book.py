@@ -0,0 +1,222 @@
+import functools
+import json
+import os
+import random
+import struct
+
+import numpy as np
+
+from .constants import BLACK, WHITE
+from .replay_shard import MAGIC as SHARD_MAGIC, MAX_DIM, ShardReader
+from .reversi_environment import ReversiEnvironment
+from .zobrist import zobrist_keys
+
+# Book file layout:
+#   MAGIC, a HEADER (dim, max_ply, number of entries), then the entries as one ENTRY array sorted
+#   by key. Each entry is one move seen in one position: the position's canonical hash, the move
+#   in the canonical frame, and how the games that played it went for the player making it.
+MAGIC = b'RVBK\x01'
+HEADER = struct.Struct('<BHI')
+ENTRY = np.dtype([('key', '<u8'), ('move', 'u1'), ('games', '<u4'), ('wins', '<u4'), ('draws', '<u4')])
+
+# The eight symmetries of the square, as maps of (row, col) on a board with last row/col `last`
+SYMMETRIES = [
+    lambda r, c, last: (r, c),
+    lambda r, c, last: (c, last - r),
+    lambda r, c, last: (last - r, last - c),
+    lambda r, c, last: (last - c, r),
+    lambda r, c, last: (c, r),
+    lambda r, c, last: (last - c, last - r),
+    lambda r, c, last: (last - r, c),
+    lambda r, c, last: (r, last - c),
+]
+
+@functools.lru_cache(maxsize=None)
+def symmetry_tables(dim):
+    '''
+    Returns (perms, inverse, black, white). perms[s, idx] is where symmetry s sends flat square
+    idx and inverse[s] undoes it. black[s, idx] and white[s, idx] are the Zobrist keys of a piece
+    on idx once moved by symmetry s, so XORing them over a board's pieces hashes its image.
+    '''
+    last = dim - 1
+    perms = np.array([[r * dim + c for r, c in (symmetry(r, c, last) for r in range(dim) for c in range(dim))] for symmetry in SYMMETRIES])
+    inverse = np.argsort(perms, axis=1)
+    keys = zobrist_keys(dim)
+    black = np.array(keys.pieces[BLACK], dtype=np.uint64)[perms]
+    white = np.array(keys.pieces[WHITE], dtype=np.uint64)[perms]
+    return (perms, inverse, black, white)
+
+def canonical(env):
+    '''
+    Returns (key, symmetries): the smallest Zobrist hash over the eight reflections and rotations
+    of env's position, and the symmetries that produce it (more than one when the position is
+    itself symmetric). Positions that are mirror images of each other get the same key.
+    '''
+    _, _, black, white = symmetry_tables(env.dim)
+    flat = np.asarray(env.board).ravel()
+    hashes = np.bitwise_xor.reduce(np.where(flat == BLACK, black, 0) ^ np.where(flat == WHITE, white, 0), axis=1)
+    key = hashes.min()
+    symmetries = tuple(np.flatnonzero(hashes == key).tolist())
+    keys = zobrist_keys(env.dim)
+    key = int(key)
+    if env.curr_player == WHITE:
+        key ^= keys.side
+    if not env.last_moved:
+        key ^= keys.passed
+    return (key, symmetries)
+
+def to_canonical(dim, symmetries, action):
+    '''
+    Flat index in the canonical frame of action ((row, col) or None for a pass, stored as dim * dim).
+    Moves that are mirror images in a symmetric position map to the same index.
+    '''
+    if action is None:
+        return dim * dim
+    perms = symmetry_tables(dim)[0]
+    return min(int(perms[symmetry, action[0] * dim + action[1]]) for symmetry in symmetries)
+
+def from_canonical(dim, symmetries, move):
+    if move == dim * dim:
+        return None
+    return divmod(int(symmetry_tables(dim)[1][symmetries[0], move]), dim)
+
+def check_dim(dim):
+    # Moves, passes included, are stored in one byte as in replay shards
+    if dim > MAX_DIM:
+        raise ValueError(f"Opening books store moves in one byte, so boards larger than {MAX_DIM}x{MAX_DIM} aren't supported (got {dim}x{dim})")
+
+def read_records(paths):
+    '''
+    Yields the game records in paths, which may be JSON replays (as written by ReversiGame),
+    replay shards, or directories of either
+    '''
+    for path in paths:
+        if os.path.isdir(path):
+            yield from read_records(sorted(os.path.join(path, name) for name in os.listdir(path)))
+        elif path.endswith('.json'):
+            with open(path) as record_fp:
+                yield json.load(record_fp)
+        else:
+            with open(path, 'rb') as fp:
+                if fp.read(len(MAGIC)) != SHARD_MAGIC:
+                    continue
+            with ShardReader(path) as reader:
+                yield from reader
+
+class OpeningBook(object):
+    '''
+    Moves played from each position of the first max_ply plies of a set of games, indexed by
+    canonical hash so that symmetric positions share their statistics. Looking a position up costs
+    one hash and one dict access however big the book is.
+    '''
+    def __init__(self, dim, max_ply, entries=None):
+        check_dim(dim)
+        self.dim = dim
+        self.max_ply = max_ply
+        self.entries = np.zeros(0, dtype=ENTRY) if entries is None else entries
+        self.index()
+
+    def index(self):
+        '''
+        Maps each key to its run of entries. entries must be sorted by key.
+        '''
+        keys, starts, counts = np.unique(self.entries['key'], return_index=True, return_counts=True)
+        self.positions = dict(zip(keys.tolist(), zip(starts.tolist(), (starts + counts).tolist())))
+
+    @classmethod
+    def build(cls, records, dim=8, max_ply=12):
+        '''
+        Indexes the first max_ply plies of every game in records with board size dim. Games of
+        other sizes and unfinished games, which have no outcome, are skipped and counted in
+        num_skipped.
+        '''
+        check_dim(dim)
+        stats = {}
+        num_games = 0
+        num_skipped = 0
+        for record in records:
+            actions = [None if action is None else tuple(action) for action, _ in record['actions']]
+            if record['dim'] != dim or not actions:
+                num_skipped += 1
+                continue
+            result = record['actions'][-1][1]
+            env = ReversiEnvironment(dim)
+            seen = []
+            for ply, action in enumerate(actions):
+                if ply < max_ply:
+                    key, symmetries = canonical(env)
+                    seen.append((key, to_canonical(dim, symmetries, action), env.curr_player))
+                _, _, game_over = env.do_move(action)
+            if not game_over:
+                num_skipped += 1
+                continue
+            for key, move, player in seen:
+                counts = stats.setdefault(key, {}).setdefault(move, [0, 0, 0])
+                counts[0] += 1
+                if result == player:
+                    counts[1] += 1
+                elif result == 0:
+                    counts[2] += 1
+            num_games += 1
+        entries = np.array(
+            [(key, move, *counts) for key in sorted(stats) for move, counts in sorted(stats[key].items())],
+            dtype=ENTRY)
+        book = cls(dim, max_ply, entries)
+        book.num_games = num_games
+        book.num_skipped = num_skipped
+        return book
+
+    @classmethod
+    def load(cls, path):
+        with open(path, 'rb') as fp:
+            data = fp.read()
+        if data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not an opening book")
+        dim, max_ply, count = HEADER.unpack_from(data, len(MAGIC))
+        entries = np.frombuffer(data, dtype=ENTRY, count=count, offset=len(MAGIC) + HEADER.size)
+        return cls(dim, max_ply, entries)
+
+    def save(self, path):
+        with open(path + '.tmp', 'wb') as fp:
+            fp.write(MAGIC)
+            fp.write(HEADER.pack(self.dim, self.max_ply, len(self.entries)))
+            fp.write(self.entries.tobytes())
+        os.replace(path + '.tmp', path)
+
+    def __len__(self):
+        return len(self.positions)
+
+    def lookup(self, env):
+        '''
+        Returns [(action, games, wins, draws), ...] for every move played from env's position, with
+        actions in env's own orientation, or [] if the position isn't in the book
+        '''
+        # A position with more than max_ply pieces added can't have been reached within max_ply plies
+        if env.dim != self.dim or sum(env.get_score().values()) - 4 >= self.max_ply:
+            return []
+        key, symmetries = canonical(env)
+        span = self.positions.get(key)
+        if span is None:
+            return []
+        entries = self.entries[span[0]:span[1]]
+        return [(from_canonical(self.dim, symmetries, move), games, wins, draws)
+                for move, games, wins, draws in zip(entries['move'].tolist(), entries['games'].tolist(), entries['wins'].tolist(), entries['draws'].tolist())]
+
+    def choose(self, env, min_games=1, choice='best'):
+        '''
+        A book move for env, or None if it is out of book.
+        min_games: ignore moves played in fewer games than this
+        choice: 'best' for the move with the highest score (wins plus half the draws, per game),
+            breaking ties by games played; 'frequent' for the most played move; 'weighted' for a
+            random move weighted by how often each was played
+        '''
+        moves = [entry for entry in self.lookup(env) if entry[1] >= min_games]
+        if not moves:
+            return None
+        if choice == 'best':
+            return max(moves, key=lambda entry: ((entry[2] + entry[3] / 2) / entry[1], entry[1]))[0]
+        if choice == 'frequent':
+            return max(moves, key=lambda entry: entry[1])[0]
+        if choice == 'weighted':
+            return random.choices([entry[0] for entry in moves], weights=[entry[1] for entry in moves])[0]
+        raise ValueError(f"Unknown book choice '{choice}'")
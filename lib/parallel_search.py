@@ -0,0 +1,65 @@
+import atexit
+import concurrent.futures
+
+from .alphabeta import alphabeta, root_search
+from .constants import BLACK
+from .move_ordering import MoveOrderer
+
+# Pools are kept for the life of the process so workers are only started once
+_pools = {}
+
+def get_pool(workers):
+    pool = _pools.get(workers)
+    if pool is None:
+        pool = concurrent.futures.ProcessPoolExecutor(max_workers=workers)
+        _pools[workers] = pool
+    return pool
+
+@atexit.register
+def shutdown_pools():
+    for pool in _pools.values():
+        pool.shutdown(wait=False)
+    _pools.clear()
+
+def search_move(state, action, depth, low, high, heuristic, move_ordering=False, batch_heuristic=None):
+    '''
+    Worker task: the value of playing action in state, searched to depth - 1 below it, from the
+    mover's point of view and within the mover's window [low, high].
+    '''
+    sign = 1 if state.curr_player == BLACK else -1
+    ordering = MoveOrderer() if move_ordering else None
+    _, reward, game_over = state.do_move(action)
+    if game_over:
+        return reward * sign
+    if sign == 1:
+        return alphabeta(state, depth - 1, low, high, heuristic, None, ordering, 1, batch_heuristic=batch_heuristic)
+    return -alphabeta(state, depth - 1, -high, -low, heuristic, None, ordering, 1, batch_heuristic=batch_heuristic)
+
+def parallel_root_search(state, depth, heuristic, pool, actions=None, move_ordering=False, batch_heuristic=None):
+    '''
+    Young Brothers Wait at the root: the first move is searched here, then all of its siblings are
+    searched in the pool with the first move's score as their bound.
+    Returns (value, best actions) exactly as root_search does, with the same set of tied moves, so
+    a seeded tie-break picks the same move as the serial search.
+
+    heuristic and batch_heuristic (see alphabeta) are sent to the workers, so must be picklable.
+    '''
+    if actions is None:
+        actions = list(state.legal_actions()) or [None]
+    sign = 1 if state.curr_player == BLACK else -1
+    ordering = MoveOrderer() if move_ordering else None
+
+    first_value, _ = root_search(state, depth, heuristic, actions=actions[:1], ordering=ordering, batch_heuristic=batch_heuristic)
+    best = first_value * sign
+    values = {0: best}
+    futures = {
+        pool.submit(search_move, state, action, depth, best, float('inf'), heuristic, move_ordering, batch_heuristic): idx
+        for idx, action in enumerate(actions) if idx > 0
+    }
+    for future in concurrent.futures.as_completed(futures):
+        values[futures[future]] = future.result()
+
+    # Anything below the first move's score is only an upper bound, but it can't tie the best
+    best = max(values.values())
+    best_actions = [action for idx, action in enumerate(actions) if values[idx] == best]
+    return (best * sign, best_actions)
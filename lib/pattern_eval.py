@@ -0,0 +1,162 @@
+import functools
+import math
+
+import numpy as np
+
+from .bitboard_environment import board2bits, moves_mask, popcount
+from .move_ordering import static_weights
+
+# Scale of the default weights. Evaluations are squashed into (-1, 1) by tanh, so these set how
+# quickly an advantage approaches a certain win.
+PATTERN_SCALE = 0.03
+MOBILITY_WEIGHT = 0.05
+STABILITY_WEIGHT = 0.1
+
+@functools.lru_cache(maxsize=None)
+def pattern_squares(dim):
+    '''
+    Returns {pattern name: array of shape (instances, squares)} of flat square indices. Every
+    instance of a pattern is a rotation or reflection of the first, with squares listed in
+    corresponding order, so they share one weight table.
+    '''
+    last = dim - 1
+    edges = [
+        [(0, c) for c in range(dim)],
+        [(last, c) for c in range(dim)],
+        [(r, 0) for r in range(dim)],
+        [(r, last) for r in range(dim)],
+    ]
+    corners = [
+        [(r0 + sr * i, c0 + sc * j) for i in range(3) for j in range(3)]
+        for r0, sr in [(0, 1), (last, -1)] for c0, sc in [(0, 1), (last, -1)]
+    ]
+    diagonals = [
+        [(i, i) for i in range(dim)],
+        [(i, last - i) for i in range(dim)],
+    ]
+    patterns = {'edge': edges, 'corner': corners, 'diagonal': diagonals}
+    return {name: np.array([[r * dim + c for r, c in instance] for instance in instances]) for name, instances in patterns.items()}
+
+def default_weights(dim):
+    '''
+    Weight tables that just add up move_ordering.static_weights over the squares of each pattern,
+    plus mobility and stability weights. A starting point for tuned tables loaded with
+    PatternEvaluator.load.
+    '''
+    square_weights = static_weights(dim)
+    weights = {}
+    for name, instances in pattern_squares(dim).items():
+        squares = [divmod(int(idx), dim) for idx in instances[0]]
+        table = np.zeros(3 ** len(squares))
+        # Digit k of a code is square k's contents: 0 empty, 1 black, 2 white
+        for k, square in enumerate(squares):
+            digits = (np.arange(len(table)) // 3 ** k) % 3
+            table += np.select([digits == 1, digits == 2], [1, -1], 0) * square_weights[square]
+        weights[name] = table * PATTERN_SCALE
+    weights['mobility'] = np.array(MOBILITY_WEIGHT)
+    weights['stability'] = np.array(STABILITY_WEIGHT)
+    return weights
+
+@functools.lru_cache(maxsize=None)
+def edge_stability(dim):
+    '''
+    For every edge pattern code, black minus white pieces on that edge that can never be flipped
+    because they are joined to a corner along the edge by pieces of their own colour. Corners are
+    shared by two edges, so each counts half on either. Depending only on the edge's contents, this
+    is folded into the edge table rather than worked out for every position.
+    '''
+    table = np.zeros(3 ** dim)
+    for code in range(len(table)):
+        digits = [(code // 3 ** k) % 3 for k in range(dim)]
+        stable = set()
+        for squares in [range(dim), range(dim - 1, -1, -1)]:
+            color = digits[squares[0]]
+            for k in squares:
+                if color == 0 or digits[k] != color:
+                    break
+                stable.add(k)
+        for k in stable:
+            share = 0.5 if k in (0, dim - 1) else 1
+            table[code] += share if digits[k] == 1 else -share
+    return table
+
+class PatternEvaluator(object):
+    '''
+    Table-driven evaluation: every edge, 3x3 corner block and main diagonal is read as a base-3
+    code indexing that pattern's weight table, and the looked-up weights are added to a weighted
+    mobility difference. The stability weight is applied to edge_stability and folded into the
+    edge table, so stable discs cost nothing extra per evaluation. Values are from BLACK's point of view and squashed into
+    (-1, 1), so they always rank below a won game's reward.
+
+    mobility: include the mobility term. It needs a move generation for each player, which is most
+    of the cost of an evaluation, so leaving it out makes evaluate several times faster.
+    '''
+    def __init__(self, dim, weights=None, mobility=True):
+        self.dim = dim
+        self.weights = default_weights(dim) if weights is None else weights
+        self.mobility = mobility
+        self.mask_bytes = -(-dim * dim // 8)
+        self.patterns = pattern_squares(dim)
+        self.powers = {name: 3 ** np.arange(squares.shape[1]) for name, squares in self.patterns.items()}
+        self.build_tables()
+
+    def build_tables(self):
+        '''
+        Folds every pattern instance into one (instances, squares) matrix of powers of 3, so that
+        multiplying it by a board's cells gives every instance's code at once, and concatenates
+        the tables into one weight vector for a single lookup, with edge stability folded into the
+        edge table. Call again after changing weights.
+        '''
+        rows = []
+        offsets = []
+        tables = []
+        offset = 0
+        for name, squares in self.patterns.items():
+            for instance in squares:
+                row = np.zeros(self.dim * self.dim, dtype=np.int64)
+                row[instance] = self.powers[name]
+                rows.append(row)
+                offsets.append(offset)
+            table = self.weights[name]
+            if name == 'edge':
+                table = table + self.weights['stability'] * edge_stability(self.dim)
+            tables.append(table)
+            offset += len(table)
+        self.code_matrix = np.array(rows)
+        self.offsets = np.array(offsets)
+        self.table = np.concatenate(tables)
+
+    @classmethod
+    def load(cls, path, mobility=True):
+        with np.load(path) as data:
+            weights = {key: data[key] for key in data.files if key != 'dim'}
+            return cls(int(data['dim']), weights, mobility)
+
+    def save(self, path):
+        np.savez(path, dim=self.dim, **self.weights)
+
+    def cells(self, black, white):
+        '''
+        Square contents as pattern code digits (0 empty, 1 black, 2 white), unpacked from bitboards
+        '''
+        data = black.to_bytes(self.mask_bytes, 'little') + white.to_bytes(self.mask_bytes, 'little')
+        bits = np.unpackbits(np.frombuffer(data, dtype=np.uint8), bitorder='little').reshape(2, -1)[:, :self.dim * self.dim]
+        return bits[0] + 2 * bits[1]
+
+    def evaluate(self, env):
+        if hasattr(env, 'black'):
+            # Bitboard positions have no board array to read, so unpack their masks instead
+            black, white = env.black, env.white
+            cells = self.cells(black, white)
+        else:
+            board = env.board
+            # -1 % 3 == 2, so this maps empty, black and white to digits 0, 1 and 2
+            cells = np.asarray(board).ravel() % 3
+        value = self.table[self.code_matrix @ cells + self.offsets].sum()
+
+        if self.mobility:
+            if not hasattr(env, 'black'):
+                black, white = board2bits(board)
+            mobility = popcount(moves_mask(black, white, self.dim)) - popcount(moves_mask(white, black, self.dim))
+            value += self.weights['mobility'] * mobility
+        return math.tanh(value)
@@ -0,0 +1,83 @@
+import time
+
+from .notation import notation2coords
+from .reversi_environment import ReversiEnvironment
+
+# Positions to count from, as the moves played from the initial position ('--' for a pass)
+POSITIONS = {
+    4: {
+        'initial': '',
+        'opening': 'c4 b4 a3',
+    },
+    6: {
+        'initial': '',
+        'opening': 'e4 e3 f2 f5',
+        'midgame': 'e4 e3 b2 b5 f2 f5 c5 f3 a6 b4',
+    },
+    8: {
+        'initial': '',
+        'opening': 'e6 f4 g3 g4 d3',
+        'midgame': 'c4 c3 d3 c5 f6 d2 b2 e3 f3 c2 c6 d6',
+    },
+}
+
+# Reference leaf counts for POSITIONS, indexed by depth - 1. The 8x8 initial counts agree with
+# the published Othello perft values.
+REFERENCE = {
+    (4, 'initial'): (4, 12, 44, 128, 424, 1256, 3624, 9116, 20044, 36540, 50704, 57436, 59564, 59980),
+    (4, 'opening'): (2, 9, 24, 78, 202, 436, 849, 1113, 1300, 1343, 1350, 1350, 1350, 1350),
+    (6, 'initial'): (4, 12, 56, 244, 1364, 7604, 47740),
+    (6, 'opening'): (7, 39, 217, 1294, 8112, 53801, 363891),
+    (6, 'midgame'): (6, 48, 307, 2433, 15960, 124787, 827559),
+    (8, 'initial'): (4, 12, 56, 244, 1396, 8200, 55092),
+    (8, 'opening'): (7, 44, 294, 2162, 17082, 142651),
+    (8, 'midgame'): (11, 141, 1373, 17482, 175351, 2275864),
+}
+
+def position(dim, moves, env_class=ReversiEnvironment):
+    env = env_class(dim)
+    for move in moves.split():
+        action = None if move == '--' else notation2coords(move)
+        if action not in (env.legal_actions() or {None}):
+            raise ValueError(f"Illegal move {move} in '{moves}'")
+        env.do_move(action)
+    return env
+
+def perft(env, depth):
+    '''
+    Number of leaves of the game tree below env, depth moves deep. A pass counts as a move; the
+    pass that ends the game is a leaf whatever the remaining depth. Leaves env as it found it.
+    '''
+    if depth == 0:
+        return 1
+    # search_moves is what alphabeta generates, so this times the same path
+    actions = env.search_moves() or [None]
+    nodes = 0
+    for action in actions:
+        undo, _, game_over = env.do_move(action)
+        nodes += 1 if game_over else perft(env, depth - 1)
+        env.undo_move(undo)
+    return nodes
+
+def run_perft(dim, name, depth, env_class=ReversiEnvironment):
+    '''
+    Counts POSITIONS[dim][name] to depth and checks the count against REFERENCE. Returns a dict
+    suitable for writing out as JSON.
+    '''
+    env = position(dim, POSITIONS[dim][name], env_class)
+    start = time.perf_counter()
+    nodes = perft(env, depth)
+    elapsed = time.perf_counter() - start
+    reference = REFERENCE.get((dim, name), ())
+    expected = reference[depth - 1] if depth <= len(reference) else None
+    return {
+        'env': env_class.__name__,
+        'dim': dim,
+        'position': name,
+        'depth': depth,
+        'nodes': nodes,
+        'expected': expected,
+        'ok': expected is None or nodes == expected,
+        'seconds': elapsed,
+        'nodes_per_second': nodes / elapsed if elapsed else None,
+    }
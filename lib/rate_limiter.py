@@ -0,0 +1,178 @@
+import asyncio
+import collections
+import threading
+import time
+
+# Rough characters-per-token ratio for English prompts, plus per-message overhead
+CHARS_PER_TOKEN = 4
+TOKENS_PER_MESSAGE = 4
+# Longest a blocked acquire sleeps before checking the queue again, in case a notify is missed
+MAX_SLEEP = 0.5
+
+def estimate_tokens(messages, max_tokens):
+    '''
+    Upper-ish estimate of the tokens a request will count against the budget: the prompt plus
+    every completion token it is allowed to generate
+    '''
+    prompt_chars = sum(len(message['content']) for message in messages)
+    return prompt_chars // CHARS_PER_TOKEN + TOKENS_PER_MESSAGE * len(messages) + max_tokens
+
+class TokenBucket(object):
+    '''
+    Refills continuously at per_minute / 60 per second, holding at most a minute's worth
+    '''
+    def __init__(self, per_minute):
+        self.capacity = per_minute
+        self.rate = per_minute / 60
+        self.level = per_minute
+        self.updated = time.monotonic()
+
+    def refill(self, now):
+        self.level = min(self.capacity, self.level + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def wait_time(self, amount, now):
+        '''
+        Seconds until amount can be taken. Requests larger than the bucket only wait for it to fill.
+        '''
+        self.refill(now)
+        amount = min(amount, self.capacity)
+        if self.level >= amount:
+            return 0
+        return (amount - self.level) / self.rate
+
+    def take(self, amount):
+        self.level -= min(amount, self.capacity)
+
+class RequestScheduler(object):
+    '''
+    Holds API requests back until they fit within requests-per-minute and tokens-per-minute
+    budgets. Waiting requests are served round-robin across owners (e.g. games) and first come,
+    first served within an owner, so one busy game can't starve the others.
+
+    A scheduler only coordinates requests within one process. Give each worker process its share
+    of the budget when running several.
+    '''
+    def __init__(self, requests_per_minute=None, tokens_per_minute=None):
+        self.requests = TokenBucket(requests_per_minute) if requests_per_minute else None
+        self.tokens = TokenBucket(tokens_per_minute) if tokens_per_minute else None
+        self.condition = threading.Condition()
+        self.queues = collections.OrderedDict()
+        self.blocked_until = 0
+
+        self.granted = 0
+        self.rate_limited = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.max_queue_depth = 0
+
+    @property
+    def queue_depth(self):
+        return sum(len(queue) for queue in self.queues.values())
+
+    def enqueue(self, owner):
+        ticket = object()
+        with self.condition:
+            self.queues.setdefault(owner, collections.deque()).append(ticket)
+            self.max_queue_depth = max(self.max_queue_depth, self.queue_depth)
+        return ticket
+
+    def dequeue(self, ticket, owner):
+        '''
+        Withdraws a ticket that was never granted, e.g. because its request was cancelled, so that
+        it doesn't hold up the requests behind it
+        '''
+        with self.condition:
+            queue = self.queues.get(owner)
+            if queue is not None and ticket in queue:
+                queue.remove(ticket)
+                if not queue:
+                    del self.queues[owner]
+                self.condition.notify_all()
+
+    def try_grant(self, ticket, owner, tokens, enqueued):
+        '''
+        Returns 0 and dequeues the ticket if it may go now, otherwise seconds to wait before asking
+        again. Must be called with the condition held.
+        '''
+        head_owner = next(iter(self.queues))
+        if self.queues[head_owner][0] is not ticket:
+            return None
+        now = time.monotonic()
+        wait = self.blocked_until - now
+        if self.requests is not None:
+            wait = max(wait, self.requests.wait_time(1, now))
+        if self.tokens is not None:
+            wait = max(wait, self.tokens.wait_time(tokens, now))
+        if wait > 0:
+            return wait
+
+        if self.requests is not None:
+            self.requests.take(1)
+        if self.tokens is not None:
+            self.tokens.take(tokens)
+        queue = self.queues[owner]
+        queue.popleft()
+        if queue:
+            self.queues.move_to_end(owner)
+        else:
+            del self.queues[owner]
+
+        waited = now - enqueued
+        self.granted += 1
+        self.total_wait += waited
+        self.max_wait = max(self.max_wait, waited)
+        self.condition.notify_all()
+        return 0
+
+    def acquire(self, tokens, owner=None):
+        '''
+        Blocks until a request of about `tokens` tokens may be sent
+        '''
+        enqueued = time.monotonic()
+        ticket = self.enqueue(owner)
+        try:
+            with self.condition:
+                while True:
+                    wait = self.try_grant(ticket, owner, tokens, enqueued)
+                    if wait == 0:
+                        return
+                    self.condition.wait(MAX_SLEEP if wait is None else min(wait, MAX_SLEEP))
+        finally:
+            # A no-op once the ticket has been granted
+            self.dequeue(ticket, owner)
+
+    async def acquire_async(self, tokens, owner=None, poll_interval=0.05):
+        '''
+        Coroutine version of acquire. Polls rather than blocking the event loop.
+        '''
+        enqueued = time.monotonic()
+        ticket = self.enqueue(owner)
+        try:
+            while True:
+                with self.condition:
+                    wait = self.try_grant(ticket, owner, tokens, enqueued)
+                if wait == 0:
+                    return
+                await asyncio.sleep(poll_interval if wait is None else min(wait, poll_interval))
+        finally:
+            self.dequeue(ticket, owner)
+
+    def rate_limited_for(self, seconds):
+        '''
+        Call when the API answers 429: nothing else is sent until `seconds` have passed
+        '''
+        with self.condition:
+            self.rate_limited += 1
+            self.blocked_until = max(self.blocked_until, time.monotonic() + seconds)
+
+    def stats(self):
+        with self.condition:
+            return {
+                'queue_depth': self.queue_depth,
+                'max_queue_depth': self.max_queue_depth,
+                'granted': self.granted,
+                'rate_limited': self.rate_limited,
+                'mean_wait': self.total_wait / self.granted if self.granted else 0.0,
+                'max_wait': self.max_wait,
+            }
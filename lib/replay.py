@@ -10,26 +10,71 @@ from .reversi_environment import ReversiEnvironment
 KEYS = 'qwertyuiopasdfghjklzxcvbnm'
 
 class Replay(object):
-    def __init__(self, record_file):
+    def __init__(self, record_file=None, checkpoint_interval=1, record=None):
+        '''
+        checkpoint_interval: keep every k-th position in memory once the game has been simulated.
+        1 (the default) keeps them all, making state_before_turn O(1); larger values trade that for
+        memory, replaying at most k-1 moves per lookup.
+        record: an already loaded game record (e.g. from a ShardReader) to use instead of record_file
+        '''
 
-        print(f"Reading game from '{record_file}'")
-        with open(record_file) as record_fp:
-            record = json.load(record_fp)
+        if record is None:
+            print(f"Reading game from '{record_file}'")
+            with open(record_file) as record_fp:
+                record = json.load(record_fp)
         self.dim = record['dim']
         self.actions = [tuple([action if action is None else tuple(action), outcome]) for action, outcome in record['actions']]
 
         self.env = ReversiEnvironment(dim=self.dim)
         self.prev_env = self.env
-    
-    def state_before_turn(self, turn):
-        curr_turn = 0
+
+        self.checkpoint_interval = checkpoint_interval
+        self.checkpoints = None
+        self.last_state = None
+
+    def __iter__(self):
+        '''
+        Yields (turn, state before the turn, action taken) for every turn, simulating the game once
+        '''
         env = self.env
+        for turn in range(len(self.actions)):
+            action = self.get_action(turn)
+            yield (turn, env, action)
+            (env, _, _) = env.act(action)
+
+    def build_checkpoints(self):
+        # Only published once complete, so that threads sharing this replay never see a partial
+        # list. Threads that race here each build a list and the last one wins.
+        checkpoints = []
+        env = self.env
+        for turn in range(len(self.actions) + 1):
+            if turn % self.checkpoint_interval == 0:
+                checkpoints.append(env)
+            if turn < len(self.actions):
+                (env, _, _) = env.act(self.get_action(turn))
+        self.checkpoints = checkpoints
+
+    def state_before_turn(self, turn):
+        '''
+        The returned environment is shared between callers and must not be modified. Safe to call
+        from several threads at once.
+        '''
+        if self.checkpoints is None:
+            self.build_checkpoints()
+        curr_turn = turn - turn % self.checkpoint_interval
+        env = self.checkpoints[curr_turn // self.checkpoint_interval]
+        # Walking forward one turn at a time shouldn't replay from the checkpoint every time. Read
+        # last_state once, since another thread may replace it meanwhile.
+        last_state = self.last_state
+        if last_state is not None and curr_turn <= last_state[0] <= turn:
+            curr_turn, env = last_state
         while curr_turn < turn:
             action = self.get_action(curr_turn)
             (env, _, _) = env.act(action)
             curr_turn += 1
+        self.last_state = (turn, env)
         return env
-    
+
     def get_action(self, turn):
         return self.actions[turn][0]
 
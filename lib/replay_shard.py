@@ -0,0 +1,141 @@
+import json
+import mmap
+import os
+import struct
+
+# Shard file layout:
+#   MAGIC, then any number of games appended back to back. Each game is a GAME_HEADER
+#   (dim, result, number of moves) followed by one byte per move: row * dim + col, or PASS.
+MAGIC = b'RVSI\x01'
+GAME_HEADER = struct.Struct('<BbH')
+PASS = 255
+# Every square index has to fit in a byte without colliding with PASS
+MAX_DIM = 15
+
+def encode_game(record):
+    '''
+    Packs a ReversiGame record ({'dim': ..., 'actions': [(action, reward), ...]}) into bytes
+    '''
+    dim = record['dim']
+    if dim > MAX_DIM:
+        raise ValueError(f"Shards store moves in one byte, so boards larger than {MAX_DIM}x{MAX_DIM} aren't supported (got {dim}x{dim})")
+    actions = record['actions']
+    result = actions[-1][1] if actions else 0
+    moves = bytes(PASS if action is None else int(action[0]) * dim + int(action[1]) for action, _ in actions)
+    return GAME_HEADER.pack(dim, result, len(moves)) + moves
+
+def game_header(data, offset):
+    '''
+    (dim, result, number of moves) of the game starting at offset. Raises ValueError if the data
+    ends before the game does, as when a write was cut short.
+    '''
+    if offset + GAME_HEADER.size > len(data):
+        raise ValueError(f"Shard truncated inside the header of the game at byte {offset}")
+    dim, result, num_moves = GAME_HEADER.unpack_from(data, offset)
+    if offset + GAME_HEADER.size + num_moves > len(data):
+        raise ValueError(f"Shard truncated inside the moves of the game at byte {offset}")
+    return (dim, result, num_moves)
+
+def decode_game(data, offset=0):
+    '''
+    Unpacks the game starting at offset into a record in the same shape ReversiGame writes
+    '''
+    dim, result, num_moves = game_header(data, offset)
+    start = offset + GAME_HEADER.size
+    actions = [(None if move == PASS else divmod(move, dim), 0) for move in data[start:start + num_moves]]
+    if actions:
+        actions[-1] = (actions[-1][0], result)
+    return {'dim': dim, 'actions': actions, 'result': result}
+
+class ShardWriter(object):
+    '''
+    Appends games to a shard file, creating it if needed
+    '''
+    def __init__(self, path):
+        self.path = path
+        is_new = not os.path.exists(path) or os.path.getsize(path) == 0
+        self.fp = open(path, 'ab')
+        if is_new:
+            self.fp.write(MAGIC)
+
+    def write(self, record):
+        self.fp.write(encode_game(record))
+
+    def flush(self):
+        self.fp.flush()
+
+    def close(self):
+        self.fp.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+class ShardReader(object):
+    '''
+    Memory-maps a shard file. Games can be iterated or accessed by index; only the small game
+    headers are read to locate a game, never the moves of the games before it.
+    '''
+    def __init__(self, path):
+        self.path = path
+        with open(path, 'rb') as fp:
+            size = os.fstat(fp.fileno()).st_size
+            self.data = mmap.mmap(fp.fileno(), 0, access=mmap.ACCESS_READ) if size else b''
+        if self.data[:len(MAGIC)] != MAGIC:
+            raise ValueError(f"'{path}' is not a replay shard")
+        self._offsets = None
+
+    @property
+    def offsets(self):
+        if self._offsets is None:
+            offsets = []
+            offset = len(MAGIC)
+            while offset < len(self.data):
+                offsets.append(offset)
+                _, _, num_moves = game_header(self.data, offset)
+                offset += GAME_HEADER.size + num_moves
+            self._offsets = offsets
+        return self._offsets
+
+    def __len__(self):
+        return len(self.offsets)
+
+    def __getitem__(self, idx):
+        return decode_game(self.data, self.offsets[idx])
+
+    def __iter__(self):
+        offset = len(MAGIC)
+        while offset < len(self.data):
+            game = decode_game(self.data, offset)
+            yield game
+            offset += GAME_HEADER.size + len(game['actions'])
+
+    def close(self):
+        if isinstance(self.data, mmap.mmap):
+            self.data.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+def convert_json_replays(json_files, shard_path):
+    '''
+    Writes JSON replays (as written by ReversiGame) to a new shard, replacing any shard already at
+    shard_path, so that converting the same replays twice doesn't store them twice. The shard is
+    written under a temporary name first. Returns the number of games written.
+    '''
+    count = 0
+    tmp_path = shard_path + '.tmp'
+    if os.path.exists(tmp_path):
+        os.remove(tmp_path)
+    with ShardWriter(tmp_path) as writer:
+        for json_file in json_files:
+            with open(json_file) as record_fp:
+                writer.write(json.load(record_fp))
+            count += 1
+    os.replace(tmp_path, shard_path)
+    return count
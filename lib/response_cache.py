@@ -0,0 +1,112 @@
+import hashlib
+import json
+import os
+import sqlite3
+import threading
+import time
+
+# Rows looked up at a time when evicting
+EVICT_BATCH = 64
+
+class CacheMissError(Exception):
+    pass
+
+class ResponseCache(object):
+    '''
+    Disk-backed cache of chat completions in a SQLite file. Safe to share between processes (each
+    opens its own connection; SQLite does the locking) and between threads of one process.
+    Least recently used responses are evicted once the stored text exceeds max_bytes.
+
+    offline: raise CacheMissError instead of returning None on a miss, so that an experiment can
+    be replayed without touching the API.
+    '''
+    def __init__(self, path, max_bytes=256 * 2**20, offline=False):
+        self.path = path
+        self.max_bytes = max_bytes
+        self.offline = offline
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.lock = threading.Lock()
+        self.conn = None
+        self.pid = None
+
+    def connection(self):
+        # Connections can't be carried across a fork, so each process opens its own
+        if self.conn is None or self.pid != os.getpid():
+            self.conn = sqlite3.connect(self.path, timeout=60, check_same_thread=False, isolation_level=None)
+            self.conn.execute('PRAGMA journal_mode=WAL')
+            self.conn.execute('CREATE TABLE IF NOT EXISTS responses (key TEXT PRIMARY KEY, response TEXT, size INTEGER, last_used REAL)')
+            self.conn.execute('CREATE INDEX IF NOT EXISTS responses_last_used ON responses (last_used)')
+            # Running total of the stored text, so puts don't have to add up the whole table
+            self.conn.execute('CREATE TABLE IF NOT EXISTS meta (name TEXT PRIMARY KEY, value INTEGER)')
+            self.conn.execute("INSERT OR IGNORE INTO meta SELECT 'bytes', COALESCE(SUM(size), 0) FROM responses")
+            self.pid = os.getpid()
+        return self.conn
+
+    @staticmethod
+    def key(model, messages, max_tokens, variant=None):
+        '''
+        messages is the full message list sent to the API, system prompt included.
+        variant distinguishes responses to the same request that were produced differently, such as
+        streamed responses cut off early.
+        '''
+        request = [model, messages, max_tokens]
+        if variant is not None:
+            request.append(variant)
+        payload = json.dumps(request, sort_keys=True)
+        return hashlib.sha256(payload.encode('utf-8')).hexdigest()
+
+    def get(self, key):
+        with self.lock:
+            conn = self.connection()
+            row = conn.execute('SELECT response FROM responses WHERE key = ?', (key,)).fetchone()
+            if row is None:
+                self.misses += 1
+                if self.offline:
+                    raise CacheMissError(f"No cached response for {key} in offline mode")
+                return None
+            self.hits += 1
+            conn.execute('UPDATE responses SET last_used = ? WHERE key = ?', (time.time(), key))
+            return row[0]
+
+    def put(self, key, response):
+        size = len(response.encode('utf-8'))
+        with self.lock:
+            conn = self.connection()
+            conn.execute('BEGIN IMMEDIATE')
+            try:
+                row = conn.execute('SELECT size FROM responses WHERE key = ?', (key,)).fetchone()
+                conn.execute('INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?)', (key, response, size, time.time()))
+                conn.execute("UPDATE meta SET value = value + ? WHERE name = 'bytes'", (size - (row[0] if row else 0),))
+                total = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+                while total > self.max_bytes:
+                    evicted = conn.execute('SELECT key, size FROM responses ORDER BY last_used LIMIT ?', (EVICT_BATCH,)).fetchall()
+                    if not evicted:
+                        break
+                    for old_key, old_size in evicted:
+                        if total <= self.max_bytes:
+                            break
+                        conn.execute('DELETE FROM responses WHERE key = ?', (old_key,))
+                        total -= old_size
+                        self.evictions += 1
+                conn.execute("UPDATE meta SET value = ? WHERE name = 'bytes'", (total,))
+                conn.execute('COMMIT')
+            except BaseException:
+                conn.execute('ROLLBACK')
+                raise
+
+    def stats(self):
+        with self.lock:
+            conn = self.connection()
+            entries = conn.execute('SELECT COUNT(*) FROM responses').fetchone()[0]
+            size = conn.execute("SELECT value FROM meta WHERE name = 'bytes'").fetchone()[0]
+        lookups = self.hits + self.misses
+        return {
+            'entries': entries,
+            'bytes': size,
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'evictions': self.evictions,
+        }
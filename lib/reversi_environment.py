@@ -1,12 +1,21 @@
-import itertools
+import collections
 
 import numpy as np
 
 from .constants import BLACK, WHITE, EMPTY, PLAYER
 from .display_board import board2str
+from .geometry import OPPOSITE, directed_rays, rays, squares
+from .zobrist import zobrist_hash, zobrist_keys
+
+# Everything do_move changed, so that undo_move can restore the position in place. moves is the
+# position's cached legal moves, if any.
+UndoRecord = collections.namedtuple('UndoRecord', ['action', 'flips', 'curr_player', 'last_moved', 'zobrist', 'moves'], defaults=(None,))
 
 class ReversiEnvironment(object):
-    def __init__(self, dim, board=None, curr_player=BLACK, last_moved=True):
+    def __init__(self, dim, board=None, curr_player=BLACK, last_moved=True, zobrist=None):
+        '''
+        zobrist: hash of the position, if already known. Computed from the board otherwise.
+        '''
         self.dim = dim
         self.board = board
         if self.board is None:
@@ -14,6 +23,14 @@ class ReversiEnvironment(object):
 
         self.curr_player = curr_player
         self.last_moved = last_moved
+        self.zobrist = zobrist
+        if self.zobrist is None:
+            self.zobrist = zobrist_hash(self.board, curr_player, last_moved)
+
+        # Legal moves, and for each the lines of pieces it flips as (direction, anchoring piece,
+        # flipped pieces). Filled in by find_moves when first needed.
+        self._legal = None
+        self._lines = None
 
     def init_board(self):    
         if self.dim % 2 != 0:
@@ -28,23 +45,52 @@ class ReversiEnvironment(object):
         self.board[self.dim//2, self.dim//2] = WHITE
 
     def legal_actions(self):
-        opponent = -self.curr_player
+        '''
+        The returned set is cached on the position and shared between callers, so must not be modified
+        '''
+        if self._legal is None:
+            self.find_moves()
+        return self._legal
 
-        found = set()
+    def search_moves(self):
+        '''
+        Legal moves in the form search passes to do_move. The same as legal_actions here; see
+        BitboardEnvironment.search_moves.
+        '''
+        return self.legal_actions()
 
-        # TODO: optimize for full board
-        for i, j in zip(*np.where(self.board == self.curr_player)):
-            for crawl in crawls_from(i, j, self.dim):
-                for idx, (i2, j2) in enumerate(crawl):
-                    if self.board[i2, j2] == EMPTY:
-                        if idx != 0:
-                            found.add((i2, j2))
-                        break
-                    if self.board[i2, j2] == self.curr_player:
-                        break
+    def find_moves(self):
+        '''
+        Finds every legal move together with the pieces it flips in one pass over the rays from the
+        current player's pieces, and caches them until the position changes
+        '''
+        player = self.curr_player
+        opponent = -player
+        square_rays = directed_rays(self.dim)
+        coords = squares(self.dim)
+        flat = self.board.ravel().tolist()
 
-        return found
+        found = set()
+        lines = {}
+        for idx, piece in enumerate(flat):
+            if piece != player:
+                continue
+            for direction, ray in square_rays[idx]:
+                # Walk over opponent pieces; an empty square right after at least one is a move
+                if flat[ray[0]] != opponent:
+                    continue
+                for n, sq in enumerate(ray):
+                    if flat[sq] != opponent:
+                        if flat[sq] == EMPTY:
+                            move = coords[sq]
+                            found.add(move)
+                            # Seen from the move, this piece anchors a line in the opposite direction
+                            flips = [coords[flip] for flip in reversed(ray[:n])]
+                            lines.setdefault(move, []).append((OPPOSITE[direction], coords[idx], flips))
+                        break
 
+        self._legal = found
+        self._lines = lines
 
     def act(self, action):
         '''
@@ -53,15 +99,33 @@ class ReversiEnvironment(object):
         - Reward
         - If game is over
         '''
-        new_board = self.board.copy()
-        opponent = -self.curr_player
-        new_last_moved = True
+        new_env = self.copy()
+        _, reward, game_over = new_env.do_move(action)
+        return (new_env, reward, game_over)
+
+    def do_move(self, action):
+        '''
+        Plays action on this environment in place.
+        Returns
+        - UndoRecord to pass to undo_move
+        - Reward
+        - If game is over
+        '''
+        player = self.curr_player
+        last_moved = self.last_moved
+        zobrist = self.zobrist
+        moves = (self._legal, self._lines)
+        keys = zobrist_keys(self.dim)
+        flipped = []
         reward = 0
         game_over = False
 
+        self.zobrist ^= keys.side
         if action is None:
-            new_last_moved = False
-            if not self.last_moved:
+            self.last_moved = False
+            if last_moved:
+                self.zobrist ^= keys.passed
+            if not last_moved:
                 game_over = True
                 scores = self.get_score()
                 if scores[BLACK] > scores[WHITE]:
@@ -69,17 +133,49 @@ class ReversiEnvironment(object):
                 elif scores[WHITE] > scores[BLACK]:
                     reward = -1
         else:
-            #if self.board[row, col] != EMPTY:
-            #    raise ValueError("Square must be empty")
-
-            for _, flips in self.check_flips(action):
-                flips_i = [i for i, _ in flips]
-                flips_j = [j for _, j in flips]
-                new_board[flips_i, flips_j] = self.curr_player
-            new_board[action] = self.curr_player
-
-        new_env = ReversiEnvironment(self.dim, new_board, opponent, new_last_moved)
-        return (new_env, reward, game_over)
+            # Reuse the flips found with the legal moves, but don't search for every move just for this one
+            lines = self._lines.get((action[0], action[1])) if self._lines is not None else None
+            if lines is None:
+                lines = self.walk_flips(action)
+            for line in lines:
+                flipped += line[-1]
+            if flipped:
+                self.board[tuple(zip(*flipped))] = player
+            self.board[action] = player
+            self.last_moved = True
+            if not last_moved:
+                self.zobrist ^= keys.passed
+
+            dim = self.dim
+            self.zobrist ^= keys.pieces[player][action[0] * dim + action[1]]
+            for i, j in flipped:
+                self.zobrist ^= keys.flips[i * dim + j]
+
+        self.curr_player = -player
+        self._legal = None
+        self._lines = None
+        return (UndoRecord(action, flipped, player, last_moved, zobrist, moves), reward, game_over)
+
+    def undo_move(self, undo):
+        '''
+        Reverts the do_move call that returned undo. Moves must be undone in reverse order.
+        '''
+        if undo.action is not None:
+            if undo.flips:
+                self.board[tuple(zip(*undo.flips))] = -undo.curr_player
+            self.board[undo.action] = EMPTY
+        self.curr_player = undo.curr_player
+        self.last_moved = undo.last_moved
+        self.zobrist = undo.zobrist
+        if undo.moves is not None:
+            self._legal, self._lines = undo.moves
+
+    def copy(self):
+        env = ReversiEnvironment(self.dim, self.board.copy(), self.curr_player, self.last_moved, self.zobrist)
+        # Caches are replaced rather than modified when the position changes, so they can be shared
+        env._legal = self._legal
+        env._lines = self._lines
+        return env
 
     def check_flips(self, action):
         '''
@@ -90,19 +186,34 @@ class ReversiEnvironment(object):
         '''
         if action is None:
             return []
+        if self._lines is None:
+            self.find_moves()
+        row, col = action
+        lines = self._lines.get((row, col))
+        if lines is None:
+            return self.walk_flips(action)
+        # Same order as walking outward from the move: by direction
+        return [(anchor, list(flips)) for _, anchor, flips in sorted(lines)]
 
+    def walk_flips(self, action):
+        '''
+        check_flips without the cache
+        '''
         row, col = action
+        player = self.curr_player
+        coords = squares(self.dim)
+        flat = self.board.ravel().tolist()
         result = []
-        for crawl in crawls_from(row, col, self.dim):
+        for ray in rays(self.dim)[row * self.dim + col]:
             potential_flips = []
-            for i, j in crawl:
-                if self.board[i, j] == self.curr_player:
+            for sq in ray:
+                if flat[sq] == player:
                     if len(potential_flips) > 0:
-                        result.append(((i, j), potential_flips))
+                        result.append((coords[sq], potential_flips))
                     break
-                elif self.board[i, j] == EMPTY:
+                elif flat[sq] == EMPTY:
                     break
-                potential_flips.append((i, j))
+                potential_flips.append(coords[sq])
         return result
      
 
@@ -113,9 +224,3 @@ class ReversiEnvironment(object):
         board_str = board2str(self.board)
         text_str = f"{PLAYER[self.curr_player]}'s turn"
         return f"{text_str}\n{board_str}"
-
-def crawls_from(i, j, dim):
-    icrawls = [[i]*dim, range(i+1, dim), range(i-1, -1, -1)]
-    jcrawls = [[j]*dim, range(j+1, dim), range(j-1, -1, -1)]
-    crawl_pairs = list(itertools.product(icrawls, jcrawls))[1:]
-    return [zip(*p) for p in crawl_pairs]
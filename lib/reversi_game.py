@@ -1,4 +1,5 @@
 import json
+import time
 
 import numpy as np
 import pandas as pd
@@ -9,26 +10,48 @@ from .replay import Replay
 from .reversi_environment import ReversiEnvironment
 
 class ReversiGame(object):
-    def __init__(self, dim, agent, record_file=None, headless=False):
-        self.env = ReversiEnvironment(dim=dim)
+    def __init__(self, dim, agent, record_file=None, headless=False, env_class=ReversiEnvironment, verbose=True, record_shard=None, instrument=False, stats_hook=None):
+        '''
+        env_class: board representation to play on, e.g. ReversiEnvironment or BitboardEnvironment
+        verbose: print progress messages such as the turn number. Set to False for bulk runs.
+        record_shard: a ShardWriter to append the finished game to, alongside or instead of record_file
+        instrument: time every choose_action call and save it in the record under 'stats', one entry
+        per action, along with the agent's search counters (see ReversiAgent.move_stats)
+        stats_hook: function called with (turn, stats entry) after every move, e.g. to feed a
+        profiler or metrics system. Implies instrument.
+        '''
+        self.env = env_class(dim=dim)
         self.prev_env = self.env
         self.agent = agent
         self.turn = 0
 
         self.headless = headless
+        self.verbose = verbose
+
+        self.instrument = instrument or stats_hook is not None
+        self.stats_hook = stats_hook
 
         self.record = {'dim': dim, 'actions': []}
+        if self.instrument:
+            self.record['stats'] = []
         self.record_file = record_file
-        if self.record_file:
+        self.record_shard = record_shard
+        if self.record_file and self.verbose:
             print(f"Recording game at '{self.record_file}'")
 
 
     def play(self):
         while(True):
-            print(f"Turn {self.turn}")
+            if self.verbose:
+                print(f"Turn {self.turn}")
             if not self.headless:
                 self.print_score()
+            if self.instrument:
+                player = self.env.curr_player
+                start = time.perf_counter()
             action = self.agent.choose_action(self.env, self.prev_env)
+            if self.instrument:
+                self.record_stats(player, action, time.perf_counter() - start)
             self.prev_env = self.env
             self.env, reward, game_over = self.env.act(action)
             self.record['actions'].append((action, reward))
@@ -37,6 +60,16 @@ class ReversiGame(object):
                 return reward
             self.turn += 1
 
+    def record_stats(self, player, action, seconds):
+        stats = {'player': player, 'seconds': seconds}
+        # A pass doesn't go through the agent's policy, so it has no search counters
+        move_stats = self.agent.move_stats(player) if action is not None else None
+        if move_stats:
+            stats.update(move_stats)
+        self.record['stats'].append(stats)
+        if self.stats_hook is not None:
+            self.stats_hook(self.turn, stats)
+
     def game_over(self, reward):
         if not self.headless:
             self.print_score()
@@ -47,6 +80,8 @@ class ReversiGame(object):
         if self.record_file is not None:
             with open(self.record_file, 'w') as record_fp:
                 json.dump(self.record, record_fp, cls=NpEncoder)
+        if self.record_shard is not None:
+            self.record_shard.write(self.record)
 
     
     def print_score(self):
@@ -0,0 +1,37 @@
+import csv
+
+class SearchStats(object):
+    '''
+    Counters for one search, filled in by alphabeta/root_search when passed as their stats argument
+    '''
+    FIELDS = ['nodes', 'cutoffs', 'leaf_evals', 'legal_actions_calls']
+
+    def __init__(self):
+        self.nodes = 0
+        self.cutoffs = 0
+        self.leaf_evals = 0
+        self.legal_actions_calls = 0
+
+    def as_dict(self):
+        return {field: getattr(self, field) for field in self.FIELDS}
+
+    def __repr__(self):
+        return f"SearchStats({', '.join(f'{field}={getattr(self, field)}' for field in self.FIELDS)})"
+
+def write_stats_csv(records, path):
+    '''
+    Writes the per-move stats of instrumented game records (ReversiGame(instrument=True)) to a CSV
+    with one row per move. records is a list of game records, or a dict of name -> record.
+    '''
+    if not isinstance(records, dict):
+        records = dict(enumerate(records))
+    rows = []
+    for game, record in records.items():
+        for turn, move_stats in enumerate(record.get('stats', [])):
+            rows.append({'game': game, 'turn': turn, **move_stats})
+    fields = ['game', 'turn', 'player', 'seconds'] + SearchStats.FIELDS
+    with open(path, 'w', newline='') as csv_fp:
+        writer = csv.DictWriter(csv_fp, fields, restval='')
+        writer.writeheader()
+        writer.writerows(rows)
+    return len(rows)
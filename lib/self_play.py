@@ -0,0 +1,143 @@
+import concurrent.futures
+import glob
+import json
+import os
+import random
+import time
+
+import numpy as np
+
+from .constants import BLACK
+from .reversi_environment import ReversiEnvironment
+
+MANIFEST = 'manifest.json'
+
+def shard_path(out_dir, shard):
+    return os.path.join(out_dir, f'shard_{shard:06d}.npz')
+
+def play_self_play_game(env_class, dim, agent_b, agent_w):
+    '''
+    Plays one headless game, keeping only what training needs. Returns (boards, players, moves,
+    result): the board before each move, the player to move, the move as row * dim + col (dim * dim
+    for a pass), and the final result.
+    '''
+    env = env_class(dim)
+    agents = {BLACK: agent_b, -BLACK: agent_w}
+    boards = []
+    players = []
+    moves = []
+    while True:
+        boards.append(np.asarray(env.board, dtype=np.int8))
+        players.append(env.curr_player)
+        # Agents only look at prev_env to display the previous move, so don't keep copies around
+        action = agents[env.curr_player].choose_action(env, env)
+        moves.append(dim * dim if action is None else int(action[0]) * dim + int(action[1]))
+        _, reward, game_over = env.do_move(action)
+        if game_over:
+            return (boards, players, moves, reward)
+
+def write_shard(out_dir, shard, shard_games, matchups, dim, seed, env_class):
+    '''
+    Plays shard_games games and saves their positions as one compressed shard. Runs in a worker
+    process. The shard is written to a temporary file first so that a crash never leaves a partial
+    shard behind.
+    '''
+    random.seed(seed)
+    boards = []
+    players = []
+    moves = []
+    outcomes = []
+    games = []
+    for g in range(shard_games):
+        agent_b, agent_w = matchups[(shard * shard_games + g) % len(matchups)]
+        game_boards, game_players, game_moves, result = play_self_play_game(env_class, dim, agent_b, agent_w)
+        boards += game_boards
+        players += game_players
+        moves += game_moves
+        outcomes += [result] * len(game_moves)
+        games += [g] * len(game_moves)
+
+    path = shard_path(out_dir, shard)
+    tmp_path = path + '.tmp.npz'
+    np.savez_compressed(
+        tmp_path,
+        boards=np.array(boards, dtype=np.int8).reshape(-1, dim, dim),
+        players=np.array(players, dtype=np.int8),
+        moves=np.array(moves, dtype=np.int16),
+        outcomes=np.array(outcomes, dtype=np.int8),
+        games=np.array(games, dtype=np.int32),
+    )
+    os.replace(tmp_path, path)
+    return len(moves)
+
+def read_manifest(out_dir):
+    path = os.path.join(out_dir, MANIFEST)
+    if not os.path.exists(path):
+        return None
+    with open(path) as manifest_fp:
+        return json.load(manifest_fp)
+
+def write_manifest(out_dir, manifest):
+    path = os.path.join(out_dir, MANIFEST)
+    with open(path + '.tmp', 'w') as manifest_fp:
+        json.dump(manifest, manifest_fp, indent=1)
+    os.replace(path + '.tmp', path)
+
+def generate_self_play(matchups, out_dir, games, dim=8, shard_games=1000, workers=None, base_seed=0, env_class=ReversiEnvironment):
+    '''
+    Plays `games` games across a process pool and saves every (position, move, outcome) in
+    compressed shards of shard_games games each, under out_dir (games is rounded up to a whole
+    number of shards). Only a few shards are in flight at once, so memory stays bounded however
+    many games are asked for.
+
+    matchups: list of (black agent, white agent) pairs; game n is played by matchups[n % len(matchups)]
+    base_seed: each shard is seeded from this and its index, so a shard's games are the same
+        whichever worker plays them
+    Calling again with the same out_dir resumes: shards listed in its manifest are skipped.
+    Returns the manifest.
+    '''
+    os.makedirs(out_dir, exist_ok=True)
+    config = {'dim': dim, 'shard_games': shard_games, 'base_seed': base_seed}
+    manifest = read_manifest(out_dir)
+    if manifest is None:
+        manifest = {'config': config, 'shards': {}}
+    elif manifest['config'] != config:
+        raise ValueError(f"'{out_dir}' holds self-play data generated with {manifest['config']}, not {config}")
+    # Shards written but not yet recorded when a previous run stopped are played again
+    for tmp_path in glob.glob(os.path.join(out_dir, '*.tmp.npz')):
+        os.remove(tmp_path)
+
+    num_shards = -(-games // shard_games)
+    todo = [shard for shard in range(num_shards) if str(shard) not in manifest['shards']]
+    print(f"{num_shards - len(todo)} of {num_shards} shards already written")
+
+    start = time.perf_counter()
+    games_played = 0
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        max_pending = 2 * (workers or os.cpu_count())
+        pending = {}
+        while todo or pending:
+            while todo and len(pending) < max_pending:
+                shard = todo.pop(0)
+                seed = f"{base_seed}/{shard}"
+                pending[pool.submit(write_shard, out_dir, shard, shard_games, matchups, dim, seed, env_class)] = shard
+            done, _ = concurrent.futures.wait(pending, return_when=concurrent.futures.FIRST_COMPLETED)
+            for future in done:
+                shard = pending.pop(future)
+                samples = future.result()
+                manifest['shards'][str(shard)] = {'file': os.path.basename(shard_path(out_dir, shard)), 'games': shard_games, 'samples': samples}
+                write_manifest(out_dir, manifest)
+                games_played += shard_games
+                elapsed = time.perf_counter() - start
+                print(f"Shard {shard}: {samples} positions. {games_played} games in {elapsed:.1f}s ({games_played / elapsed:.1f} games/sec)")
+    return manifest
+
+def load_self_play(out_dir):
+    '''
+    Yields each shard listed in out_dir's manifest as a dict of arrays (boards, players, moves,
+    outcomes, games)
+    '''
+    manifest = read_manifest(out_dir)
+    for shard in sorted(manifest['shards'], key=int):
+        with np.load(os.path.join(out_dir, manifest['shards'][shard]['file'])) as data:
+            yield {key: data[key] for key in data.files}
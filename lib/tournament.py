@@ -0,0 +1,83 @@
+import concurrent.futures
+import os
+import random
+
+import pandas as pd
+
+from .agents import DualAgent
+from .constants import BLACK, WHITE
+from .reversi_game import ReversiGame
+
+def matchups(agent_names, rounds):
+    '''
+    Every ordered pair of distinct agents, once per round, in the order baseline_game.py used
+    '''
+    for i in range(rounds):
+        for black_pname in agent_names:
+            for white_pname in agent_names:
+                if black_pname != white_pname:
+                    yield (i, black_pname, white_pname)
+
+def game_seed(base_seed, i, black_pname, white_pname):
+    # String seeds are hashed deterministically by random.seed, unlike hash()
+    return f"{base_seed}/{i}/{black_pname}/{white_pname}"
+
+def play_game(dim, agents, i, black_pname, white_pname, seed, verbose=False, replay_dir=None, env_class=None):
+    '''
+    Plays one game and returns its results row. Runs in a worker process.
+    '''
+    random.seed(seed)
+    record_file = None
+    if replay_dir is not None:
+        record_file = os.path.join(replay_dir, f'{black_pname}_{white_pname}_{i}.json')
+    dual = DualAgent(agents[black_pname], agents[white_pname])
+    kwargs = {} if env_class is None else {'env_class': env_class}
+    rg = ReversiGame(dim, dual, headless=True, record_file=record_file, verbose=verbose, **kwargs)
+    result = rg.play()
+
+    if result == BLACK:
+        victor = black_pname
+    elif result == WHITE:
+        victor = white_pname
+    else:
+        victor = 'Tie'
+    return {'player_B': black_pname, 'player_W': white_pname, 'victor': victor}
+
+def run_tournament(agents, dim=6, rounds=100, workers=None, base_seed=0, verbose=False, replay_dir=None, results_file=None, env_class=None):
+    '''
+    Plays every ordered pairing of agents (a dict of name -> ReversiAgent) `rounds` times across a
+    process pool and returns a DataFrame with player_B, player_W and victor columns.
+
+    workers: pool size, defaults to the number of CPUs
+    base_seed: each game is seeded from this and its matchup, so results are reproducible no matter
+        which worker plays it or in what order games finish
+    verbose: print every turn of every game
+    replay_dir: if set, write a JSON replay per game there
+    results_file: if set, append each result to this CSV as soon as its game finishes
+    '''
+    if replay_dir is not None:
+        os.makedirs(replay_dir, exist_ok=True)
+    if results_file is not None and os.path.exists(results_file):
+        os.remove(results_file)
+
+    results = []
+    with concurrent.futures.ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(play_game, dim, agents, i, black_pname, white_pname, game_seed(base_seed, i, black_pname, white_pname), verbose, replay_dir, env_class)
+            for i, black_pname, white_pname in matchups(list(agents), rounds)
+        ]
+        for done, future in enumerate(concurrent.futures.as_completed(futures), 1):
+            row = future.result()
+            results.append(row)
+            if results_file is not None:
+                pd.DataFrame([row]).to_csv(results_file, mode='a', index=False, header=(done == 1))
+            print(f"[{done}/{len(futures)}] {row['player_B']} vs {row['player_W']}: {row['victor']}")
+    return pd.DataFrame(results, columns=['player_B', 'player_W', 'victor'])
+
+def summarize_results(df):
+    df['player1'] = df[['player_B', 'player_W']].min(axis=1)
+    df['player2'] = df[['player_B', 'player_W']].max(axis=1)
+    df = df.drop(columns=['player_B', 'player_W'])
+    df['count'] = 1
+    df = df.groupby(['player1', 'player2', 'victor']).count()
+    print(df)
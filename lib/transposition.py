@@ -0,0 +1,65 @@
+import collections
+
+EXACT = 0
+LOWER = 1
+UPPER = 2
+
+TTEntry = collections.namedtuple('TTEntry', ['key', 'depth', 'value', 'flag', 'best_move', 'generation'])
+
+class TranspositionTable(object):
+    '''
+    Fixed-size table of search results keyed by Zobrist hash. Each key maps to a single slot;
+    on a collision the deeper result is kept, unless the stored one is left over from an earlier
+    search (see new_search), in which case it is always replaced.
+    '''
+    def __init__(self, size=2**18):
+        self.size = size
+        self.generation = 0
+        self.clear()
+
+    def clear(self):
+        self.entries = [None] * self.size
+        self.hits = 0
+        self.misses = 0
+        self.stores = 0
+        self.replacements = 0
+        self.rejections = 0
+
+    def new_search(self):
+        '''
+        Marks everything stored so far as stale. Stale entries are still used for lookups but lose
+        any replacement contest.
+        '''
+        self.generation += 1
+
+    def lookup(self, key):
+        entry = self.entries[key % self.size]
+        if entry is not None and entry.key == key:
+            self.hits += 1
+            return entry
+        self.misses += 1
+        return None
+
+    def store(self, key, depth, value, flag, best_move):
+        slot = key % self.size
+        old = self.entries[slot]
+        if old is not None and old.key != key:
+            if old.generation == self.generation and old.depth > depth:
+                self.rejections += 1
+                return
+            self.replacements += 1
+        self.entries[slot] = TTEntry(key, depth, value, flag, best_move, self.generation)
+        self.stores += 1
+
+    def stats(self):
+        lookups = self.hits + self.misses
+        return {
+            'size': self.size,
+            'used': sum(1 for entry in self.entries if entry is not None),
+            'hits': self.hits,
+            'misses': self.misses,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+            'stores': self.stores,
+            'replacements': self.replacements,
+            'rejections': self.rejections,
+        }
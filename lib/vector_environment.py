@@ -0,0 +1,149 @@
+import numpy as np
+
+from .constants import BLACK, WHITE
+from .geometry import DIRECTIONS
+from .reversi_environment import ReversiEnvironment
+
+def shift(x, dr, dc):
+    '''
+    Moves every square of a stack of boards (N, dim, dim) one step in direction (dr, dc). Squares
+    shifted off the edge are dropped and the ones left behind are False.
+    '''
+    dim = x.shape[1]
+    out = np.zeros_like(x)
+    out[:, max(dr, 0):dim + min(dr, 0), max(dc, 0):dim + min(dc, 0)] = x[:, max(-dr, 0):dim + min(-dr, 0), max(-dc, 0):dim + min(-dc, 0)]
+    return out
+
+def legal_moves(own, opp):
+    '''
+    Given stacks of boards (N, dim, dim) marking one player's pieces and their opponent's, returns
+    where that player may move in each
+    '''
+    dim = own.shape[1]
+    empty = ~(own | opp)
+    moves = np.zeros_like(own)
+    for dr, dc in DIRECTIONS:
+        # Runs of opponent pieces that start next to one of ours...
+        run = shift(own, dr, dc) & opp
+        for _ in range(dim - 3):
+            run |= shift(run, dr, dc) & opp
+        # ...can be captured by playing on the empty square at their end
+        moves |= shift(run, dr, dc) & empty
+    return moves
+
+class VectorReversiEnvironment(object):
+    '''
+    num_envs games played in lockstep on one (num_envs, dim, dim) board array, for RL training.
+    Actions are square indices row * dim + col, with dim * dim meaning pass, which (as in
+    ReversiEnvironment) is only legal when there is no other move. Rewards are from BLACK's point
+    of view.
+
+    auto_reset: put finished games back to the initial position as part of step
+    The legal mask is cached between steps, so call reset after editing boards directly.
+    '''
+    def __init__(self, num_envs, dim, auto_reset=True):
+        self.num_envs = num_envs
+        self.dim = dim
+        self.auto_reset = auto_reset
+        self.boards = np.zeros((num_envs, dim, dim), dtype=np.int8)
+        self.curr_player = np.zeros(num_envs, dtype=np.int8)
+        self.last_moved = np.zeros(num_envs, dtype=bool)
+        self._legal = None
+        self.reset()
+
+    @property
+    def pass_action(self):
+        return self.dim * self.dim
+
+    def reset(self, mask=None):
+        '''
+        Puts the games selected by the boolean array mask (all of them by default) back to the
+        initial position
+        '''
+        if mask is None:
+            mask = np.ones(self.num_envs, dtype=bool)
+        initial = ReversiEnvironment(self.dim).board
+        self.boards[mask] = initial
+        self.curr_player[mask] = BLACK
+        self.last_moved[mask] = True
+        self._legal = None
+
+    def own_opp(self):
+        player = self.curr_player[:, None, None]
+        return (self.boards == player, self.boards == -player)
+
+    def legal_mask(self):
+        '''
+        (num_envs, dim * dim + 1) boolean array of legal actions, the last column being pass
+        '''
+        if self._legal is not None:
+            return self._legal
+        own, opp = self.own_opp()
+        moves = legal_moves(own, opp).reshape(self.num_envs, -1)
+        no_moves = ~moves.any(axis=1)
+        self._legal = np.concatenate([moves, no_moves[:, None]], axis=1)
+        return self._legal
+
+    def flips(self, actions):
+        '''
+        (num_envs, dim, dim) boolean array of the pieces each action would flip. Passes flip nothing.
+        '''
+        dim = self.dim
+        own, opp = self.own_opp()
+        placed = np.zeros(self.num_envs * dim * dim, dtype=bool)
+        moved = actions != self.pass_action
+        placed[(np.arange(self.num_envs) * dim * dim + actions)[moved]] = True
+        placed = placed.reshape(self.num_envs, dim, dim)
+
+        flipped = np.zeros_like(own)
+        for dr, dc in DIRECTIONS:
+            run = shift(placed, dr, dc) & opp
+            frontier = run
+            for _ in range(dim - 3):
+                frontier = shift(frontier, dr, dc) & opp
+                run |= frontier
+            # The run is captured only if it ends against one of our pieces
+            bounded = (shift(run, dr, dc) & own).any(axis=(1, 2))
+            flipped |= run & bounded[:, None, None]
+        return flipped
+
+    def step(self, actions):
+        '''
+        Plays one action in every game. Returns (rewards, dones): rewards are non-zero only for games
+        that just ended. With auto_reset those games have already been reset on return.
+        '''
+        actions = np.asarray(actions)
+        legal = self.legal_mask()
+        if not legal[np.arange(self.num_envs), actions].all():
+            bad = np.flatnonzero(~legal[np.arange(self.num_envs), actions])
+            raise ValueError(f"Illegal actions in games {bad.tolist()}")
+
+        passed = actions == self.pass_action
+        flipped = self.flips(actions)
+        player = self.curr_player[:, None, None]
+        self.boards = np.where(flipped, player, self.boards)
+        moved = np.flatnonzero(~passed)
+        rows, cols = np.divmod(actions[moved], self.dim)
+        self.boards[moved, rows, cols] = self.curr_player[moved]
+
+        dones = passed & ~self.last_moved
+        black, white = self.get_score()
+        rewards = np.where(dones, np.sign(black - white), 0).astype(np.int8)
+        self.last_moved = ~passed
+        self.curr_player = -self.curr_player
+        self._legal = None
+        if self.auto_reset and dones.any():
+            self.reset(dones)
+        return (rewards, dones)
+
+    def get_score(self):
+        '''
+        Returns (black counts, white counts), one entry per game
+        '''
+        return ((self.boards == BLACK).sum(axis=(1, 2)), (self.boards == WHITE).sum(axis=(1, 2)))
+
+    def env(self, idx):
+        '''
+        Copy of game idx as a ReversiEnvironment
+        '''
+        return ReversiEnvironment(self.dim, self.boards[idx].astype(int), int(self.curr_player[idx]), bool(self.last_moved[idx]))
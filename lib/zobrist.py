@@ -0,0 +1,40 @@
+import collections
+import functools
+import random
+
+import numpy as np
+
+from .constants import BLACK, WHITE
+
+# pieces: player -> one key per square, flips: BLACK ^ WHITE key per square (flipping a piece
+# swaps one for the other), side: white to move, passed: previous player passed
+ZobristKeys = collections.namedtuple('ZobristKeys', ['pieces', 'flips', 'side', 'passed'])
+
+@functools.lru_cache(maxsize=None)
+def zobrist_keys(dim):
+    # Seeded per dimension so hashes are reproducible across processes and runs
+    rng = random.Random(f"zobrist-{dim}")
+    squares = dim * dim
+    pieces = {
+        BLACK: [rng.getrandbits(64) for _ in range(squares)],
+        WHITE: [rng.getrandbits(64) for _ in range(squares)],
+    }
+    flips = [b ^ w for b, w in zip(pieces[BLACK], pieces[WHITE])]
+    return ZobristKeys(pieces, flips, rng.getrandbits(64), rng.getrandbits(64))
+
+def zobrist_hash(board, curr_player, last_moved):
+    '''
+    Hashes a position from scratch. Environments keep their hash up to date incrementally, so this
+    is only needed when one is constructed from a bare board.
+    '''
+    board = np.asarray(board)
+    keys = zobrist_keys(board.shape[0])
+    result = 0
+    for player in [BLACK, WHITE]:
+        for idx in np.flatnonzero(board.ravel() == player):
+            result ^= keys.pieces[player][idx]
+    if curr_player == WHITE:
+        result ^= keys.side
+    if not last_moved:
+        result ^= keys.passed
+    return result
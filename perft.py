@@ -0,0 +1,33 @@
+import json
+import sys
+
+from lib.bitboard_environment import BitboardEnvironment
+from lib.perft import POSITIONS, run_perft
+from lib.reversi_environment import ReversiEnvironment
+
+# Usage: python perft.py [numpy|bitboard] [results file]
+# Counts every position in lib/perft.py up to DEPTHS[dim], checks the counts against the reference
+# values and writes the results as JSON. Exits with status 1 if any count is wrong.
+DEPTHS = {4: 12, 6: 6, 8: 5}
+ENVIRONMENTS = {'numpy': ReversiEnvironment, 'bitboard': BitboardEnvironment}
+
+env_name = sys.argv[1] if len(sys.argv) > 1 else 'numpy'
+results_file = sys.argv[2] if len(sys.argv) > 2 else f'perft_{env_name}.json'
+env_class = ENVIRONMENTS[env_name]
+
+results = []
+print(f"{'dim':>3} {'position':<10} {'depth':>5} {'nodes':>10} {'nodes/s':>10}")
+for dim, positions in POSITIONS.items():
+    for name in positions:
+        for depth in range(1, DEPTHS[dim] + 1):
+            result = run_perft(dim, name, depth, env_class)
+            results.append(result)
+            status = '' if result['ok'] else f"  WRONG, expected {result['expected']}"
+            print(f"{dim:>3} {name:<10} {depth:>5} {result['nodes']:>10} {result['nodes_per_second'] or 0:>10.0f}{status}")
+
+with open(results_file, 'w') as results_fp:
+    json.dump(results, results_fp, indent=1)
+
+failures = [result for result in results if not result['ok']]
+print(f"{len(results) - len(failures)}/{len(results)} counts correct. Results written to '{results_file}'")
+sys.exit(1 if failures else 0)
@@ -0,0 +1,21 @@
+import sys
+
+from lib.agents import RandomAgent, ScoreGreedyAgent, ScoreMinimaxAgent
+from lib.bitboard_environment import BitboardEnvironment
+from lib.self_play import generate_self_play
+
+# Usage: python self_play.py [output dir] [number of games]
+# Rerunning with the same output dir picks up where a previous run stopped.
+DIM = 8
+SHARD_GAMES = 1000
+WORKERS = None
+
+random = RandomAgent()
+greedy = ScoreGreedyAgent()
+minimax2 = ScoreMinimaxAgent(2)
+matchups = [(random, random), (greedy, random), (random, greedy), (minimax2, greedy), (greedy, minimax2)]
+
+if __name__ == '__main__':
+    out_dir = sys.argv[1] if len(sys.argv) > 1 else 'self_play'
+    games = int(sys.argv[2]) if len(sys.argv) > 2 else 100000
+    generate_self_play(matchups, out_dir, games, dim=DIM, shard_games=SHARD_GAMES, workers=WORKERS, env_class=BitboardEnvironment)
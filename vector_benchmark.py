@@ -0,0 +1,45 @@
+import sys
+import time
+
+import numpy as np
+
+from lib.bitboard_environment import BitboardEnvironment
+from lib.reversi_environment import ReversiEnvironment
+from lib.vector_environment import VectorReversiEnvironment
+
+# Usage: python vector_benchmark.py [number of games] [board size]
+# Steps games with uniformly random legal moves and reports environment steps per second, against
+# stepping the same number of single environments one at a time.
+STEPS = 200
+
+def random_actions(legal, rng):
+    return np.argmax(rng.random(legal.shape) * legal, axis=1)
+
+def vector_steps_per_second(num_envs, dim, rng):
+    vec = VectorReversiEnvironment(num_envs, dim)
+    start = time.perf_counter()
+    for _ in range(STEPS):
+        vec.step(random_actions(vec.legal_mask(), rng))
+    return num_envs * STEPS / (time.perf_counter() - start)
+
+def single_steps_per_second(env_class, num_envs, dim, rng):
+    envs = [env_class(dim) for _ in range(num_envs)]
+    steps = max(1, STEPS // 10)
+    start = time.perf_counter()
+    for _ in range(steps):
+        for i, env in enumerate(envs):
+            legal_actions = sorted(env.legal_actions())
+            action = legal_actions[rng.integers(len(legal_actions))] if legal_actions else None
+            _, _, game_over = env.do_move(action)
+            if game_over:
+                envs[i] = env_class(dim)
+    return num_envs * steps / (time.perf_counter() - start)
+
+if __name__ == '__main__':
+    num_envs = int(sys.argv[1]) if len(sys.argv) > 1 else 1024
+    dim = int(sys.argv[2]) if len(sys.argv) > 2 else 8
+    rng = np.random.default_rng(0)
+    print(f"{num_envs} games on {dim}x{dim}")
+    print(f"VectorReversiEnvironment: {vector_steps_per_second(num_envs, dim, rng):.0f} steps/s")
+    print(f"ReversiEnvironment:       {single_steps_per_second(ReversiEnvironment, num_envs, dim, rng):.0f} steps/s")
+    print(f"BitboardEnvironment:      {single_steps_per_second(BitboardEnvironment, num_envs, dim, rng):.0f} steps/s")